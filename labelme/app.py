@@ -23,13 +23,17 @@ from config import get_config
 from labelme.label_file import LabelFile
 from labelme.label_file import LabelFileError
 from labelme.logger import logger
+from labelme.segmentation import SegmentationPrefetcher
 from labelme.shape import Shape
+from labelme.utils.features import ImageFeatures
+from labelme.utils.tiles import TiledImage
 from labelme.widgets import BrightnessContrastDialog
 from widgets.canvas import Canvas
 from labelme.widgets import FileDialogPreview
 from labelme.widgets import LabelDialog
 from labelme.widgets import LabelListWidget
 from labelme.widgets import LabelListWidgetItem
+from labelme.widgets import ToleranceWidget
 from labelme.widgets import ToolBar
 from labelme.widgets import UniqueLabelQListWidget
 from labelme.widgets import ZoomWidget
@@ -168,6 +172,9 @@ class MainWindow(QtWidgets.QMainWindow):
         self.file_dock.setWidget(fileListWidget)
 
         self.zoomWidget = ZoomWidget()
+        self.toleranceWidget = ToleranceWidget(
+            self._config["magic_wand"]["tolerance"]
+        )
         self.setAcceptDrops(True)
 
         # self.imageMagicWand = cv2.imread(self.imagePath)
@@ -178,8 +185,20 @@ class MainWindow(QtWidgets.QMainWindow):
             double_click=self._config["canvas"]["double_click"],
             num_backups=self._config["canvas"]["num_backups"],
             crosshair=self._config["canvas"]["crosshair"],
+            magic_wand_batch_interval=self._config["magic_wand"][
+                "batch_interval"
+            ],
+            segmentation={
+                key: value
+                for key, value in self._config["segmentation"].items()
+                if not key.startswith("prefetch")
+            },
         )
         self.canvas.zoomRequest.connect(self.zoomRequest)
+        self.segmentationPrefetcher = SegmentationPrefetcher(
+            self.canvas.segmentation.client,
+            max_workers=self._config["segmentation"]["prefetch_workers"],
+        )
 
         scrollArea = QtWidgets.QScrollArea()
         scrollArea.setWidget(self.canvas)
@@ -429,6 +448,14 @@ class MainWindow(QtWidgets.QMainWindow):
             self.tr("Undo last drawn point"),
             enabled=False,
         )
+        redoMagicWand = action(
+            self.tr("Redo magic wand click"),
+            self.canvas.redoMagicWand,
+            shortcuts["redo_magic_wand"],
+            "redo",
+            self.tr("Redo the last undone magic wand click"),
+            enabled=False,
+        )
         removePoint = action(
             text="Remove Selected Point",
             slot=self.removeSelectedPoint,
@@ -486,6 +513,15 @@ class MainWindow(QtWidgets.QMainWindow):
         )
         self.zoomWidget.setEnabled(False)
 
+        tolerance = QtWidgets.QWidgetAction(self)
+        tolerance.setDefaultWidget(self.toleranceWidget)
+        self.toleranceWidget.setWhatsThis(
+            self.tr(
+                "Color tolerance of the magic wand. Changing it redoes the "
+                "last Shift/Alt click inside the box."
+            )
+        )
+
         zoomIn = action(
             self.tr("Zoom &In"),
             functools.partial(self.addZoom, 1.1),
@@ -607,6 +643,7 @@ class MainWindow(QtWidgets.QMainWindow):
             copy=copy,
             paste=paste,
             undoLastPoint=undoLastPoint,
+            redoMagicWand=redoMagicWand,
             undo=undo,
             removePoint=removePoint,
             createMode=createMode,
@@ -638,6 +675,7 @@ class MainWindow(QtWidgets.QMainWindow):
                 None,
                 undo,
                 undoLastPoint,
+                redoMagicWand,
                 None,
                 removePoint,
                 None,
@@ -660,6 +698,7 @@ class MainWindow(QtWidgets.QMainWindow):
                 delete,
                 undo,
                 undoLastPoint,
+                redoMagicWand,
                 removePoint,
             ),
             onLoadActive=(
@@ -758,6 +797,7 @@ class MainWindow(QtWidgets.QMainWindow):
             createMode,
             # createRectangleMode,
             createBoxMode,
+            tolerance,
             editMode,
             duplicate,
             copy,
@@ -828,6 +868,9 @@ class MainWindow(QtWidgets.QMainWindow):
 
         # Callbacks:
         self.zoomWidget.valueChanged.connect(self.paintCanvas)
+        self.toleranceWidget.valueChanged.connect(
+            self.canvas.setMagicWandTolerance
+        )
 
         self.populateModeActions()
 
@@ -967,6 +1010,7 @@ class MainWindow(QtWidgets.QMainWindow):
         """
         self.actions.editMode.setEnabled(not drawing)
         self.actions.undoLastPoint.setEnabled(drawing)
+        self.actions.redoMagicWand.setEnabled(drawing)
         self.actions.undo.setEnabled(not drawing)
         self.actions.delete.setEnabled(not drawing)
 
@@ -1241,6 +1285,7 @@ class MainWindow(QtWidgets.QMainWindow):
             flags = shape["flags"]
             group_id = shape["group_id"]
             other_data = shape["other_data"]
+            holes = shape.get("holes", [])
 
             if not points:
                 # skip point-empty shape
@@ -1251,10 +1296,16 @@ class MainWindow(QtWidgets.QMainWindow):
                 shape_type=shape_type,
                 group_id=group_id,
             )
-            for x, y in points:
-                shape.addPoint(QtCore.QPointF(x, y))
-                # print("Point 2:",x,y)
+            # set at once, addPoint copies all the points on each call; like
+            # addPoint, points back on the first one only close the shape
+            first = tuple(points[0])
+            shape.points = [
+                QtCore.QPointF(x, y)
+                for i, (x, y) in enumerate(points)
+                if i == 0 or (x, y) != first
+            ]
             shape.close()
+            shape.holes = holes
 
             default_flags = {}
             if self._config["label_flags"]:
@@ -1285,12 +1336,14 @@ class MainWindow(QtWidgets.QMainWindow):
             data.update(
                 dict(
                     label=s.label.encode("utf-8") if PY2 else s.label,
-                    points=[(p.x(), p.y()) for p in s.points],
+                    points=s.array.tolist(),
                     group_id=s.group_id,
                     shape_type=s.shape_type,
                     flags=s.flags,
                 )
             )
+            if s.holes:
+                data["holes"] = [hole.tolist() for hole in s.holes]
             return data
 
         shapes = [format_shape(item.shape()) for item in self.labelList]
@@ -1397,10 +1450,16 @@ class MainWindow(QtWidgets.QMainWindow):
         if text:
             self.labelList.clearSelection()
             shape = self.canvas.setLastLabel(text, flags)
+            # the other regions of a magic wand selection
+            count = self.canvas.lastShapesCount
+            for part in self.canvas.shapes[-count:-1]:
+                part.group_id = group_id
+                self.addLabel(part)
             shape.group_id = group_id
             self.addLabel(shape)
             self.actions.editMode.setEnabled(True)
             self.actions.undoLastPoint.setEnabled(False)
+            self.actions.redoMagicWand.setEnabled(False)
             self.actions.undo.setEnabled(True)
             self.setDirty()
         else:
@@ -1502,10 +1561,6 @@ class MainWindow(QtWidgets.QMainWindow):
     def loadFile(self, filename=None):
         """Load the specified file, or the last opened file if None."""
         # changing fileListWidget loads file
-
-        self.canvas.imageFilename = filename
-        self.canvas.imageMagicWand = cv2.imread(filename)
-        self.canvas.imageSelectionWindow = SelectionWindow(self.canvas.imageMagicWand)
         if filename in self.imageList and (
             self.fileListWidget.currentRow() != self.imageList.index(filename)
         ):
@@ -1579,6 +1634,50 @@ class MainWindow(QtWidgets.QMainWindow):
         self.filename = filename
         if self._config["keep_prev"]:
             prev_shapes = self.canvas.shapes
+        # only for the file actually loaded, once it is known to load
+        self.canvas.imageFilename = filename
+        if (
+            self.canvas.segmentation.client.sessions
+            and not self.segmentationPrefetcher.uploaded(filename)
+        ):
+            # so that box requests only need to send the image_id
+            self.canvas.segmentation.upload(filename)
+        if self.canvas.imageFeatures is not None:
+            self.canvas.imageFeatures.cancel()
+        if self._config["magic_wand"]["tile_size"]:
+            self.canvas.imageMagicWand = TiledImage.open(
+                filename,
+                tile_size=self._config["magic_wand"]["tile_size"],
+                max_tiles=self._config["magic_wand"]["max_tiles"],
+            )
+            # features of the whole image would defeat the tiling
+            self.canvas.imageFeatures = None
+        else:
+            self.canvas.imageMagicWand = cv2.imread(filename)
+            self.canvas.imageFeatures = ImageFeatures(
+                self.canvas.imageMagicWand
+            )
+            if self._config["magic_wand"]["method"] == "pyramid":
+                # the other methods never read the pyramid
+                self.canvas.imageFeatures.start(
+                    self._config["magic_wand"]["pyramid_depth"]
+                )
+        self.canvas.imageSelectionWindow = SelectionWindow(
+            self.canvas.imageMagicWand,
+            connectivity=self._config["magic_wand"]["connectivity"],
+            tolerance=self.toleranceWidget.value(),
+            method=self._config["magic_wand"]["method"],
+            pyramid_depth=self._config["magic_wand"]["pyramid_depth"],
+            features=self.canvas.imageFeatures,
+            history_budget=self._config["magic_wand"]["history_budget"]
+            * 1024
+            * 1024,
+            simplify_tolerance=self._config["magic_wand"][
+                "simplify_tolerance"
+            ],
+            max_vertices=self._config["magic_wand"]["max_vertices"],
+            contour_mode=self._config["magic_wand"]["contour_mode"],
+        )
         self.canvas.loadPixmap(QtGui.QPixmap.fromImage(image))
         flags = {k: False for k in self._config["flags"] or []}
         if self.labelFile:
@@ -1629,6 +1728,14 @@ class MainWindow(QtWidgets.QMainWindow):
         self.brightnessContrast_values[self.filename] = (brightness, contrast)
         if brightness is not None or contrast is not None:
             dialog.onNewValue(None)
+        if self.filename in self.imageList:
+            # get the segmentation of the next images ready
+            index = self.imageList.index(self.filename) + 1
+            self.segmentationPrefetcher.prefetch(
+                self.imageList[
+                    index : index + self._config["segmentation"]["prefetch"]
+                ]
+            )
         self.paintCanvas()
         self.addRecentFile(self.filename)
         self.toggleActions(True)
@@ -1688,6 +1795,8 @@ class MainWindow(QtWidgets.QMainWindow):
         self.settings.setValue("window/position", self.pos())
         self.settings.setValue("window/state", self.saveState())
         self.settings.setValue("recentFiles", self.recentFiles)
+        if event.isAccepted():
+            self.segmentationPrefetcher.close()
         # ask the use for where to save the labels
         # self.settings.setValue('window/geometry', self.saveGeometry())
 
@@ -0,0 +1,86 @@
+import argparse
+import os
+
+from labelme.logger import logger
+from labelme.segmentation.backends import LocalClient
+from labelme.segmentation.server import SegmentationQueue
+from labelme.segmentation.server import SegmentationServer
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="serve the segmentation API of the box tool",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--backend",
+        default="grabcut",
+        choices=sorted(LocalClient.BACKENDS),
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="worker processes",
+    )
+    parser.add_argument(
+        "--max-batch",
+        type=int,
+        default=8,
+        help="requests segmented in one task of a worker at most",
+    )
+    parser.add_argument(
+        "--batch-wait",
+        type=float,
+        default=5,
+        help="ms to wait for more requests to batch with the first one",
+    )
+    parser.add_argument(
+        "--padding",
+        type=int,
+        default=32,
+        help="pixels around the box sent to the workers",
+    )
+    parser.add_argument(
+        "--max-images",
+        type=int,
+        default=16,
+        help="images kept for sessions",
+    )
+    parser.add_argument("--grabcut-iterations", type=int, default=3)
+    parser.add_argument("--floodfill-tolerance", type=int, default=32)
+    args = parser.parse_args()
+
+    options = {
+        "grabcut": dict(iterations=args.grabcut_iterations),
+        "floodfill": dict(tolerance=args.floodfill_tolerance),
+    }[args.backend]
+    segment = SegmentationQueue(
+        args.backend,
+        workers=args.workers,
+        max_batch=args.max_batch,
+        batch_wait=args.batch_wait / 1000,
+        padding=args.padding,
+        options=options,
+    )
+    server = SegmentationServer(
+        (args.host, args.port), segment=segment, max_images=args.max_images
+    )
+    logger.info(
+        "Serving on http://{}:{}/get_main_object, metrics at /metrics".format(
+            *server.server_address
+        )
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        segment.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+# flake8: noqa
+
+from .backends import LocalClient
+from .backends import create_client
+from .cache import ResponseCache
+from .client import SegmentationClient
+from .client import SegmentationWorker
+from .prefetch import SegmentationPrefetcher
@@ -0,0 +1,212 @@
+"""Segmentation on this machine, without the segmentation API.
+
+Each backend outlines the main object in a box of an image and returns a
+list of [x, y] points, see LocalClient.
+"""
+
+import concurrent.futures
+import multiprocessing
+import threading
+
+import cv2
+import numpy as np
+
+from labelme.logger import logger
+from labelme.segmentation.client import SegmentationClient
+from labelme.segmentation.client import crop_box
+
+
+def grabcut(img, box, iterations=3, margin=10):
+    """Outline of the foreground in box = (x1, y1, x2, y2) of img."""
+    h, w = img.shape[:2]
+    x1, y1, x2, y2 = box
+    left, right = sorted((int(round(x1)), int(round(x2))))
+    top, bottom = sorted((int(round(y1)), int(round(y2))))
+    corners = [[left, top], [right, top], [right, bottom], [left, bottom]]
+    # grabCut on the box and a margin around it, for the background model
+    c0, r0 = max(left - margin, 0), max(top - margin, 0)
+    c1, r1 = min(right + margin + 1, w), min(bottom + margin + 1, h)
+    rect = (
+        left - c0,
+        top - r0,
+        min(right, w - 1) - left,
+        min(bottom, h - 1) - top,
+    )
+    if rect[2] < 2 or rect[3] < 2 or rect[0] < 0 or rect[1] < 0:
+        return corners
+    region = np.ascontiguousarray(img[r0:r1, c0:c1])
+    mask = np.zeros(region.shape[:2], dtype=np.uint8)
+    bgd_model = np.zeros((1, 65), dtype=np.float64)
+    fgd_model = np.zeros((1, 65), dtype=np.float64)
+    cv2.grabCut(
+        region,
+        mask,
+        rect,
+        bgd_model,
+        fgd_model,
+        iterations,
+        cv2.GC_INIT_WITH_RECT,
+    )
+    foreground = np.isin(mask, [cv2.GC_FGD, cv2.GC_PR_FGD]).astype(np.uint8)
+    contours = cv2.findContours(
+        foreground, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+    )[-2]
+    if not contours:
+        return corners
+    contour = max(contours, key=cv2.contourArea).reshape(-1, 2)
+    return (contour + (c0, r0)).tolist()
+
+
+def floodfill(img, box, tolerance=32, connectivity=4):
+    """Outline of the flood fill from the center of box = (x1, y1, x2, y2).
+
+    This is the fill of the magic wand, confined to the box and with
+    tolerance on each channel.
+    """
+    # not at the top: labelme.widgets imports the canvas, which imports this
+    # package, and the processes running grabcut need none of the widgets
+    from labelme.widgets.magicwand import FloodFillEngine
+
+    x1, y1, x2, y2 = [int(round(v)) for v in box]
+    corners = [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
+    engine = FloodFillEngine(img, connectivity=connectivity)
+    engine.set_box(x1, y1, x2, y2)
+    mask = engine.fill((x1 + x2) // 2, (y1 + y2) // 2, (tolerance,) * 3)
+    contours = cv2.findContours(
+        mask,
+        cv2.RETR_EXTERNAL,
+        cv2.CHAIN_APPROX_SIMPLE,
+        offset=engine.origin,
+    )[-2]
+    if not contours:
+        return corners
+    return max(contours, key=cv2.contourArea).reshape(-1, 2).tolist()
+
+
+def segment_batch(backend, items, options=None):
+    """Outline of each (img, box) of items with the backend named backend.
+
+    One call for a batch of requests, in a worker process. Returns the
+    points of each item, or the exception it raised.
+    """
+    segment = LocalClient.BACKENDS[backend]
+    results = []
+    for img, box in items:
+        try:
+            results.append(segment(img, box, **(options or {})))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+class LocalClient(object):
+    """Outlines the main object in a box on this machine.
+
+    It stands in for SegmentationClient: backend is one of BACKENDS, called
+    with the keyword arguments options on the box and padding pixels around
+    it. The calls run in a pool of max_workers processes, started on the
+    first request, so they neither block the GUI nor hold the GIL.
+    """
+
+    BACKENDS = {"grabcut": grabcut, "floodfill": floodfill}
+
+    # there is no server to keep the images
+    sessions = False
+
+    def __init__(
+        self, backend="grabcut", max_workers=2, padding=32, options=None
+    ):
+        if backend not in self.BACKENDS:
+            raise ValueError(
+                "Unexpected segmentation backend: {}".format(backend)
+            )
+        self.backend = backend
+        self.max_workers = max_workers
+        self.padding = padding
+        self.options = dict(options or {})
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawned, forking a process with the GUI threads is unsafe
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def upload(self, filename):
+        pass
+
+    def _submit(self, img, box):
+        region, box, origin, _ = crop_box(img, box, self.padding)
+        future = self._pool().submit(
+            self.BACKENDS[self.backend],
+            np.ascontiguousarray(region),
+            box,
+            **self.options
+        )
+        return future, origin
+
+    def segment(self, img, filename, box):
+        """Polygon around the main object in box, like SegmentationClient.
+
+        Only the box region of img is sent to the worker process.
+        """
+        future, origin = self._submit(img, box)
+        points = np.asarray(future.result(), dtype=np.float64)
+        return points.reshape(-1, 2) + origin
+
+    def segment_boxes(self, img, filename, boxes):
+        """Polygons of several boxes, like SegmentationClient.segment_boxes.
+
+        The boxes are segmented in parallel in the pool.
+        """
+        futures = {}
+        for index, box in enumerate(boxes):
+            future, origin = self._submit(img, box)
+            futures[future] = (index, origin)
+        for future in concurrent.futures.as_completed(futures):
+            index, origin = futures[future]
+            if future.exception() is not None:
+                logger.warning(
+                    "Segmentation failed: {}".format(future.exception())
+                )
+                yield index, None
+                continue
+            points = np.asarray(future.result(), dtype=np.float64)
+            yield index, points.reshape(-1, 2) + origin
+
+
+def create_client(
+    backend="remote",
+    local_workers=2,
+    grabcut_iterations=3,
+    floodfill_tolerance=32,
+    **kwargs
+):
+    """Client of the segmentation config section.
+
+    backend is "remote" for a SegmentationClient of the other keyword
+    arguments, or one of LocalClient.BACKENDS.
+    """
+    if backend == "remote":
+        return SegmentationClient(**kwargs)
+    options = {
+        "grabcut": dict(iterations=grabcut_iterations),
+        "floodfill": dict(tolerance=floodfill_tolerance),
+    }.get(backend)
+    return LocalClient(
+        backend,
+        max_workers=local_workers,
+        padding=kwargs.get("padding", 32),
+        options=options,
+    )
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+import os.path as osp
+import tempfile
+import threading
+
+
+class ResponseCache(object):
+    """Polygons from the segmentation API, kept on disk across sessions.
+
+    Each entry is a JSON file named after the hash of its key, whose
+    modification time is when it was last used. Once the entries take more
+    than max_bytes, the least recently used ones are removed.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self.directory = osp.expanduser(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        """(mtime, path, size) of the entries."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def _path(self, key):
+        digest = hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+        return osp.join(self.directory, digest + ".json")
+
+    def get(self, key):
+        """Points stored for key, or None."""
+        key = json.loads(json.dumps(key))
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                content = json.load(f)
+            os.utime(path, None)
+        except (OSError, ValueError):
+            return None
+        if content.get("key") != key:
+            return None
+        return content["points"]
+
+    def put(self, key, points):
+        key = json.loads(json.dumps(key))
+        path = self._path(key)
+        data = json.dumps({"key": key, "points": points}).encode("utf-8")
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        with self._lock:
+            if osp.exists(path):
+                self._size -= osp.getsize(path)
+            os.replace(tmp, path)
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        self._size = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+
+    def clear(self):
+        with self._lock:
+            for _, path, _ in self._entries():
+                os.remove(path)
+            self._size = 0
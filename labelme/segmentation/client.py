@@ -0,0 +1,498 @@
+import concurrent.futures
+import hashlib
+import json
+import math
+import os
+import os.path as osp
+import threading
+
+import cv2
+import numpy as np
+import requests
+import requests.adapters
+from qtpy import QtCore
+from urllib3.util.retry import Retry
+
+from labelme.logger import logger
+from labelme.segmentation.cache import ResponseCache
+
+
+def _retry(retries, backoff):
+    # POST too: the API only computes a polygon, so requests are idempotent
+    kwargs = dict(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False,
+    )
+    try:
+        return Retry(allowed_methods=None, **kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist=None, **kwargs)
+
+
+def crop_box(img, box, padding, max_side=None):
+    """Region of img around box, and how to map points back to img.
+
+    The region has padding pixels around box and is downscaled so that its
+    longest side is at most max_side, if any. Returns the region, box in
+    region coordinates and the (x, y) origin and scale of the region in img.
+    """
+    h, w = img.shape[:2]
+    x1, y1, x2, y2 = box
+    left, right = sorted((x1, x2))
+    top, bottom = sorted((y1, y2))
+    c0 = min(max(int(math.floor(left)) - padding, 0), w)
+    r0 = min(max(int(math.floor(top)) - padding, 0), h)
+    c1 = max(min(int(math.ceil(right)) + padding + 1, w), c0)
+    r1 = max(min(int(math.ceil(bottom)) + padding + 1, h), r0)
+    region = img[r0:r1, c0:c1]
+    scale = 1.0
+    if max_side and max(region.shape[:2]) > max_side:
+        scale = max_side / max(region.shape[:2])
+        size = (
+            max(int(round((c1 - c0) * scale)), 1),
+            max(int(round((r1 - r0) * scale)), 1),
+        )
+        region = cv2.resize(region, size, interpolation=cv2.INTER_AREA)
+    box = (
+        (x1 - c0) * scale,
+        (y1 - r0) * scale,
+        (x2 - c0) * scale,
+        (y2 - r0) * scale,
+    )
+    return region, box, (c0, r0), scale
+
+
+# binary points: little-endian (N, 2) arrays of the dtype in the
+# Content-Type, "application/x-labelme-points; dtype=<i2" for instance
+POINTS_MEDIA_TYPE = "application/x-labelme-points"
+POINTS_DTYPES = ["<i2", "<f4"]
+
+
+def encode_points(points):
+    """Content type and body of points in the binary format.
+
+    They are int16 if they are all integers that fit, float32 otherwise.
+    """
+    points = np.asarray(points).reshape(-1, 2)
+    dtype = "<f4"
+    if (
+        points.size == 0
+        or (points == np.round(points)).all()
+        and np.abs(points).max() <= np.iinfo(np.int16).max
+    ):
+        dtype = "<i2"
+    content_type = "{}; dtype={}".format(POINTS_MEDIA_TYPE, dtype)
+    return content_type, points.astype(dtype).tobytes()
+
+
+def decode_points(response):
+    """Points of a response, binary or {"points": [...]} JSON.
+
+    Binary points are read in place from the content, as a (N, 2) array.
+    """
+    content_type = response.headers.get("Content-Type", "")
+    media_type, _, params = content_type.partition(";")
+    if media_type.strip() != POINTS_MEDIA_TYPE:
+        points = json.loads(response.content.decode("utf-8"))["points"]
+        return np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    dtype = params.partition("dtype=")[2].strip()
+    if dtype not in POINTS_DTYPES:
+        raise ValueError("Unexpected points dtype: {}".format(dtype))
+    return np.frombuffer(response.content, dtype=dtype).reshape(-1, 2)
+
+
+class SegmentationClient(object):
+    """Client of the segmentation API, outlining the main object in a box.
+
+    Requests share a keep-alive session, so connections are reused, and
+    failed ones are retried up to retries times, after backoff * 2 ** n
+    seconds. token, if any, is sent as a bearer token.
+
+    Only the box is uploaded, see segment, so the server gets box coordinates
+    relative to the uploaded region.
+
+    With sessions, the server keeps the images it was sent instead, under
+    their image_id (the SHA-256 of the file), and box requests only send
+    the image_id and the box in image coordinates:
+
+    - image_id, x1, y1, x2, y2: the polygon in the box of a known image,
+      or a 404 response if the server does not know the image (any more)
+    - image_id, image[, x1, y1, x2, y2]: store the image file, and answer
+      the box if any
+
+    See labelme.segmentation.server for a server implementing it.
+
+    With cache_dir, the polygons received are kept in a ResponseCache of
+    cache_size MB there, by image_id, box rounded to box_quantum pixels,
+    url and model_version, and used instead of asking the server again.
+
+    With response_format "binary", the client asks for the points in the
+    binary format of POINTS_MEDIA_TYPE rather than JSON, with the Accept
+    header. Servers that ignore it answer JSON, which is read as well.
+    """
+
+    def __init__(
+        self,
+        url="http://202.191.58.201/get_main_object",
+        token=None,
+        connect_timeout=5,
+        timeout=60,
+        retries=3,
+        backoff=0.5,
+        pool_size=2,
+        padding=32,
+        max_side=None,
+        codec=None,
+        quality=90,
+        sessions=False,
+        cache_dir=None,
+        cache_size=64,
+        box_quantum=4,
+        model_version=None,
+        response_format="json",
+    ):
+        if response_format not in ["json", "binary"]:
+            raise ValueError(
+                "Unexpected response_format: {}".format(response_format)
+            )
+        self.url = url
+        self.sessions = sessions
+        self.padding = padding
+        self.max_side = max_side
+        self.codec = codec
+        self.quality = quality
+        self.timeout = (connect_timeout, timeout)
+        self.session = requests.Session()
+        if token:
+            self.session.headers["Authorization"] = "Bearer {}".format(token)
+        if response_format == "binary":
+            self.session.headers["Accept"] = "{}, application/json".format(
+                POINTS_MEDIA_TYPE
+            )
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=_retry(retries, backoff),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # filename: (mtime, size, image_id)
+        self._image_ids = {}
+        self.cache = None
+        if cache_dir:
+            self.cache = ResponseCache(
+                cache_dir, max_bytes=cache_size * 1024 * 1024
+            )
+        self.box_quantum = box_quantum
+        self.model_version = model_version
+
+    def close(self):
+        self.session.close()
+
+    def _crop(self, img, box):
+        return crop_box(img, box, self.padding, self.max_side)
+
+    def _encode(self, img, filename):
+        """img encoded with codec, or in the format of filename if None."""
+        if self.codec:
+            extension = "." + self.codec.lstrip(".")
+            filename = osp.splitext(filename)[0] + extension
+        else:
+            extension = osp.splitext(filename)[1]
+        params = []
+        if extension.lower() in [".jpg", ".jpeg"]:
+            params = [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        elif extension.lower() == ".webp":
+            params = [cv2.IMWRITE_WEBP_QUALITY, self.quality]
+        ok, data = cv2.imencode(extension, np.ascontiguousarray(img), params)
+        if not ok:
+            raise ValueError("Unexpected image codec: {}".format(extension))
+        return filename, data
+
+    def image_id(self, filename):
+        """SHA-256 of the file, cached until it changes."""
+        stat = os.stat(filename)
+        cached = self._image_ids.get(filename)
+        if cached and cached[:2] == (stat.st_mtime, stat.st_size):
+            return cached[2]
+        sha256 = hashlib.sha256()
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha256.update(chunk)
+        image_id = sha256.hexdigest()
+        self._image_ids[filename] = (stat.st_mtime, stat.st_size, image_id)
+        return image_id
+
+    def _post(self, form_data, filename=None, stream=False):
+        files = None
+        if filename is not None:
+            with open(filename, "rb") as f:
+                files = {"image": (osp.basename(filename), f.read())}
+        return self.session.post(
+            self.url,
+            files=files,
+            data=form_data,
+            timeout=self.timeout,
+            stream=stream,
+        )
+
+    def upload(self, filename):
+        """Send the image file to the server, if it uses sessions."""
+        if not self.sessions:
+            return
+        response = self._post(
+            {"image_id": self.image_id(filename)}, filename=filename
+        )
+        response.raise_for_status()
+
+    def cache_key(self, filename, box):
+        quantum = self.box_quantum or 1
+        box = [int(round(v / quantum)) * quantum for v in box]
+        return [self.image_id(filename), box, self.url, self.model_version]
+
+    def segment(self, img, filename, box):
+        """Polygon around the main object in box = (x1, y1, x2, y2).
+
+        img is the BGR image loaded from filename. Only the box, with padding
+        pixels around it and downscaled to max_side if larger, is uploaded,
+        encoded with codec, unless the server uses sessions. Returns the
+        points in img as a (N, 2) float array.
+        """
+        if self.cache is None:
+            return self._segment(img, filename, box)
+        key = self.cache_key(filename, box)
+        points = self.cache.get(key)
+        if points is not None:
+            return np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        points = self._segment(img, filename, box)
+        self.cache.put(key, points.tolist())
+        return points
+
+    def _segment(self, img, filename, box):
+        if self.sessions:
+            x1, y1, x2, y2 = box
+            form_data = {"x1": x1, "y1": y1, "x2": x2, "y2": y2}
+            form_data["image_id"] = self.image_id(filename)
+            data = self._post(form_data)
+            if data.status_code == 404:
+                # unknown image, send it along
+                data = self._post(form_data, filename=filename)
+            data.raise_for_status()
+            return decode_points(data).astype(np.float64)
+
+        region, (x1, y1, x2, y2), (ox, oy), scale = self._crop(img, box)
+        file = {"image": self._encode(region, filename)}
+        form_data = {"x1": x1, "y1": y1, "x2": x2, "y2": y2}
+        data = self.session.post(
+            self.url, files=file, data=form_data, timeout=self.timeout
+        )
+        data.raise_for_status()
+        return decode_points(data) / scale + (ox, oy)
+
+    def segment_boxes(self, img, filename, boxes):
+        """Polygons of several boxes of img, asked for in one request.
+
+        The boxes are sent together as a JSON list in the boxes field, with
+        the image or its image_id as in segment. Without sessions, the region
+        uploaded covers all of them. The server decodes the image once and
+        streams the polygons back as they are ready, as lines of
+        {"index": i, "points": [...]} JSON, or {"index": i, "error": ...}.
+
+        Yields (i, points) for the i-th box, with points as in segment, or
+        None if the server failed on that box, in the order they arrive.
+        Cached boxes come first and are not sent.
+        """
+        boxes = [tuple(box) for box in boxes]
+        todo = []
+        for index, box in enumerate(boxes):
+            points = None
+            if self.cache is not None:
+                points = self.cache.get(self.cache_key(filename, box))
+            if points is None:
+                todo.append(index)
+            else:
+                yield index, np.asarray(points, dtype=np.float64).reshape(
+                    -1, 2
+                )
+        if not todo:
+            return
+
+        if self.sessions:
+            form_data = {
+                "image_id": self.image_id(filename),
+                "boxes": json.dumps([boxes[i] for i in todo]),
+            }
+            response = self._post(form_data, stream=True)
+            if response.status_code == 404:
+                # unknown image, send it along
+                response.close()
+                response = self._post(
+                    form_data, filename=filename, stream=True
+                )
+            (ox, oy), scale = (0, 0), 1.0
+        else:
+            xs = [x for i in todo for x in boxes[i][0::2]]
+            ys = [y for i in todo for y in boxes[i][1::2]]
+            region, _, (ox, oy), scale = self._crop(
+                img, (min(xs), min(ys), max(xs), max(ys))
+            )
+            form_data = {
+                "boxes": json.dumps(
+                    [
+                        [
+                            (x1 - ox) * scale,
+                            (y1 - oy) * scale,
+                            (x2 - ox) * scale,
+                            (y2 - oy) * scale,
+                        ]
+                        for x1, y1, x2, y2 in (boxes[i] for i in todo)
+                    ]
+                )
+            }
+            response = self.session.post(
+                self.url,
+                files={"image": self._encode(region, filename)},
+                data=form_data,
+                timeout=self.timeout,
+                stream=True,
+            )
+
+        with response:
+            response.raise_for_status()
+            content_type = response.headers.get("Content-Type", "")
+            if not content_type.startswith("application/x-ndjson"):
+                raise ValueError(
+                    "Unexpected response to boxes: {}".format(content_type)
+                )
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                result = json.loads(line.decode("utf-8"))
+                index = todo[result["index"]]
+                if "points" not in result:
+                    yield index, None
+                    continue
+                points = np.asarray(result["points"], dtype=np.float64)
+                points = points.reshape(-1, 2) / scale + (ox, oy)
+                if self.cache is not None:
+                    self.cache.put(
+                        self.cache_key(filename, boxes[index]), points.tolist()
+                    )
+                yield index, points
+
+
+class SegmentationWorker(QtCore.QObject):
+    """Runs the segment requests of a client off the GUI thread.
+
+    Only the latest request is current: submit() supersedes the previous one
+    and cancel() drops it, and the results of superseded or cancelled
+    requests are never delivered. Requests already sent still run to the
+    end, in one of max_workers threads.
+    """
+
+    # request id, points
+    finished = QtCore.Signal(int, object)
+    # request id, error message
+    failed = QtCore.Signal(int, str)
+    # request id, index of the box, points or None, see submit_boxes
+    segmented = QtCore.Signal(int, int, object)
+
+    def __init__(self, client, max_workers=2, parent=None):
+        super(SegmentationWorker, self).__init__(parent)
+        self.client = client
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers
+        )
+        self._lock = threading.Lock()
+        self._current = 0
+        self._pending = False
+
+    @property
+    def pending(self):
+        """Whether the current request has not finished yet."""
+        return self._pending
+
+    def submit(self, img, filename, box):
+        """Request the polygon in box, see SegmentationClient.segment.
+
+        Returns the id of the request, passed along with its result.
+        """
+        request_id = self._next()
+        self._executor.submit(self._run, request_id, img, filename, box)
+        return request_id
+
+    def submit_boxes(self, img, filename, boxes):
+        """Request the polygons of several boxes, see segment_boxes.
+
+        The polygon of each box is delivered with segmented as it arrives,
+        then finished is emitted with None points. Returns the request id.
+        """
+        request_id = self._next()
+        self._executor.submit(
+            self._run_boxes, request_id, img, filename, boxes
+        )
+        return request_id
+
+    def _next(self):
+        with self._lock:
+            self._current += 1
+            self._pending = True
+            return self._current
+
+    def upload(self, filename):
+        """Run SegmentationClient.upload in the background."""
+        future = self._executor.submit(self.client.upload, filename)
+        future.add_done_callback(self._uploaded)
+
+    @staticmethod
+    def _uploaded(future):
+        if future.exception() is not None:
+            logger.warning(
+                "Segmentation API upload failed: {}".format(future.exception())
+            )
+
+    def cancel(self):
+        with self._lock:
+            self._current += 1
+            self._pending = False
+
+    def _done(self, request_id):
+        with self._lock:
+            if request_id != self._current:
+                return False
+            self._pending = False
+            return True
+
+    def _run(self, request_id, img, filename, box):
+        if request_id != self._current:
+            # superseded before it was even sent
+            return
+        try:
+            points = self.client.segment(img, filename, box)
+        except Exception as e:
+            if self._done(request_id):
+                self.failed.emit(request_id, str(e))
+            return
+        if self._done(request_id):
+            self.finished.emit(request_id, points)
+
+    def _run_boxes(self, request_id, img, filename, boxes):
+        if request_id != self._current:
+            return
+        try:
+            for index, points in self.client.segment_boxes(
+                img, filename, boxes
+            ):
+                if request_id != self._current:
+                    # cancelled, closing the response
+                    return
+                self.segmented.emit(request_id, index, points)
+        except Exception as e:
+            if self._done(request_id):
+                self.failed.emit(request_id, str(e))
+            return
+        if self._done(request_id):
+            self.finished.emit(request_id, None)
@@ -0,0 +1,65 @@
+import concurrent.futures
+
+from labelme.logger import logger
+
+
+class SegmentationPrefetcher(object):
+    """Gets the segmentation of upcoming images ready in the background.
+
+    Box requests are not known before the user draws them, so only the part
+    they all share is done ahead: the image_id of each image given to
+    prefetch is computed, which every request and cache key needs, and the
+    image is uploaded if the client uses sessions. At most max_workers
+    images are worked on at a time, and the ones not started yet are
+    dropped when prefetch is called again without them.
+    """
+
+    def __init__(self, client, max_workers=1):
+        self.client = client
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers
+        )
+        # filename: future, only called from one thread
+        self._futures = {}
+
+    def prefetch(self, filenames):
+        """Prefetch filenames, in order, instead of the previous ones."""
+        for filename, future in list(self._futures.items()):
+            if future.done():
+                if future.cancelled() or future.exception() is not None:
+                    # try again next time
+                    del self._futures[filename]
+            elif filename not in filenames and future.cancel():
+                del self._futures[filename]
+        for filename in filenames:
+            if filename not in self._futures:
+                future = self._executor.submit(self._prefetch, filename)
+                future.add_done_callback(self._done)
+                self._futures[filename] = future
+
+    def uploaded(self, filename):
+        """Whether filename was prefetched, so that it need not be again."""
+        future = self._futures.get(filename)
+        return (
+            future is not None
+            and future.done()
+            and not future.cancelled()
+            and future.exception() is None
+        )
+
+    def close(self):
+        self.prefetch([])
+        self._executor.shutdown(wait=False)
+
+    @staticmethod
+    def _done(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(
+                "Segmentation prefetch failed: {}".format(future.exception())
+            )
+
+    def _prefetch(self, filename):
+        if self.client.sessions:
+            self.client.upload(filename)
+        elif hasattr(self.client, "image_id"):
+            self.client.image_id(filename)
@@ -0,0 +1,378 @@
+"""Segmentation API server, to use and test labelme offline.
+
+It implements the /get_main_object form-data contract and the image
+session protocol of SegmentationClient, outlining the main object in a box
+with one of the local backends. labelme_serve_seg runs it:
+
+    labelme_serve_seg --port 8000 --workers 4
+"""
+
+import collections
+import concurrent.futures
+import email.parser
+import hashlib
+import http.server
+import json
+import multiprocessing
+import queue
+import threading
+import time
+import urllib.parse
+
+import cv2
+import numpy as np
+
+from labelme.logger import logger
+from labelme.segmentation.backends import LocalClient
+from labelme.segmentation.backends import grabcut
+from labelme.segmentation.backends import segment_batch
+from labelme.segmentation.client import POINTS_MEDIA_TYPE
+from labelme.segmentation.client import crop_box
+from labelme.segmentation.client import encode_points
+
+
+def _percentiles(values, percents=(50, 90, 99)):
+    if not values:
+        return {"p{}".format(p): None for p in percents}
+    return {
+        "p{}".format(p): float(v)
+        for p, v in zip(percents, np.percentile(values, percents))
+    }
+
+
+class SegmentationQueue(object):
+    """Segments boxes in a pool of worker processes, in micro-batches.
+
+    Calls from concurrent requests are queued, and each of the workers
+    takes all the requests waiting, up to max_batch of them, when it is
+    free; the first one waits for others at most batch_wait seconds. The
+    batch is one task of the pool, so its overhead is shared by requests
+    that arrive together. Only the box region, with padding pixels around
+    it, is sent to the workers.
+    """
+
+    def __init__(
+        self,
+        backend="grabcut",
+        workers=2,
+        max_batch=8,
+        batch_wait=0.005,
+        padding=32,
+        options=None,
+    ):
+        if backend not in LocalClient.BACKENDS:
+            raise ValueError(
+                "Unexpected segmentation backend: {}".format(backend)
+            )
+        self.backend = backend
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.padding = padding
+        self.options = dict(options or {})
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self._queue = queue.Queue()
+        self._slots = threading.Semaphore(workers)
+        self._lock = threading.Lock()
+        self._running = 0
+        self._batches = 0
+        self._batched = 0
+        self._thread = threading.Thread(target=self._dispatch, daemon=True)
+        self._thread.start()
+
+    def submit(self, img, box):
+        """Future of the points of the main object in box of img."""
+        region, box, origin, _ = crop_box(img, box, self.padding)
+        future = concurrent.futures.Future()
+        self._queue.put((np.ascontiguousarray(region), box, origin, future))
+        return future
+
+    def __call__(self, img, box):
+        """Points of the main object in box of img, waiting for the pool."""
+        return self.submit(img, box).result()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._executor.shutdown()
+
+    def _batch(self):
+        """Next batch of queued requests, None once closed."""
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(
+                    timeout=max(deadline - time.monotonic(), 0)
+                )
+            except queue.Empty:
+                break
+            if item is None:
+                # closing, after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _dispatch(self):
+        while True:
+            self._slots.acquire()
+            batch = self._batch()
+            if batch is None:
+                return
+            with self._lock:
+                self._running += 1
+                self._batches += 1
+                self._batched += len(batch)
+            future = self._executor.submit(
+                segment_batch,
+                self.backend,
+                [(region, box) for region, box, _, _ in batch],
+                self.options,
+            )
+            future.add_done_callback(
+                lambda future, batch=batch: self._done(batch, future)
+            )
+
+    def _done(self, batch, future):
+        with self._lock:
+            self._running -= 1
+        self._slots.release()
+        if future.exception() is not None:
+            for _, _, _, request in batch:
+                request.set_exception(future.exception())
+            return
+        for (_, _, (ox, oy), request), result in zip(batch, future.result()):
+            if isinstance(result, Exception):
+                request.set_exception(result)
+            else:
+                request.set_result([[x + ox, y + oy] for x, y in result])
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "running_batches": self._running,
+                "batches": self._batches,
+                "mean_batch_size": (
+                    self._batched / self._batches if self._batches else None
+                ),
+            }
+
+
+def parse_form(content_type, body):
+    """Fields of a form body, as bytes for the files of multipart ones."""
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        fields = urllib.parse.parse_qs(body.decode("utf-8"))
+        return {name: values[-1] for name, values in fields.items()}
+    message = email.parser.BytesParser().parsebytes(
+        b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body
+    )
+    form = {}
+    if not message.is_multipart():
+        return form
+    for part in message.get_payload():
+        name = part.get_param("name", header="content-disposition")
+        payload = part.get_payload(decode=True)
+        if part.get_filename() is None:
+            payload = payload.decode("utf-8")
+        form[name] = payload
+    return form
+
+
+class SegmentationRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        form = parse_form(self.headers.get("Content-Type", ""), body)
+        image_id = form.get("image_id")
+        if "image" in form:
+            if (
+                image_id is not None
+                and hashlib.sha256(form["image"]).hexdigest() != image_id
+            ):
+                return self._reply(400, {"error": "image_id mismatch"})
+            img = cv2.imdecode(
+                np.frombuffer(form["image"], dtype=np.uint8), cv2.IMREAD_COLOR
+            )
+            if img is None:
+                return self._reply(400, {"error": "undecodable image"})
+            if image_id is not None:
+                self.server.store(image_id, img)
+        elif image_id is not None:
+            img = self.server.image(image_id)
+            if img is None:
+                return self._reply(404, {"error": "unknown image_id"})
+        else:
+            return self._reply(400, {"error": "no image nor image_id"})
+
+        if "boxes" in form:
+            try:
+                boxes = [
+                    [float(v) for v in box]
+                    for box in json.loads(form["boxes"])
+                ]
+            except (TypeError, ValueError):
+                return self._reply(400, {"error": "undecodable boxes"})
+            if any(len(box) != 4 for box in boxes):
+                return self._reply(400, {"error": "undecodable boxes"})
+            return self._stream_boxes(img, boxes)
+
+        try:
+            box = [float(form[key]) for key in ["x1", "y1", "x2", "y2"]]
+        except KeyError:
+            return self._reply(200, {"image_id": image_id})
+        start = self.server.request_started()
+        try:
+            points = self.server.segment(img, box)
+        except Exception as e:
+            self.server.request_finished(start, failed=True)
+            logger.exception("Segmentation failed")
+            return self._reply(500, {"error": str(e)})
+        self.server.request_finished(start)
+        if POINTS_MEDIA_TYPE in self.headers.get("Accept", ""):
+            return self._send(200, *encode_points(points))
+        return self._reply(200, {"points": np.asarray(points).tolist()})
+
+    def _stream_boxes(self, img, boxes):
+        """Answer the boxes as they are segmented, a line of JSON each."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        starts = [self.server.request_started() for _ in boxes]
+        for index, points in self.server.segment_boxes(img, boxes):
+            failed = isinstance(points, Exception)
+            self.server.request_finished(starts[index], failed=failed)
+            if failed:
+                result = {"index": index, "error": str(points)}
+            else:
+                result = {
+                    "index": index,
+                    "points": np.asarray(points).tolist(),
+                }
+            self._chunk((json.dumps(result) + "\n").encode("utf-8"))
+        self._chunk(b"")
+
+    def _chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if urllib.parse.urlsplit(self.path).path != "/metrics":
+            return self._reply(404, {"error": "not found"})
+        return self._reply(200, self.server.metrics())
+
+    def _reply(self, code, content):
+        self._send(
+            code, "application/json", json.dumps(content).encode("utf-8")
+        )
+
+    def _send(self, code, content_type, body):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class SegmentationServer(http.server.ThreadingHTTPServer):
+    """Segmentation API server, keeping the last max_images images sent.
+
+    segment(img, box) outlines the object, in the request thread: pass a
+    SegmentationQueue to run it in a pool of processes instead. GET
+    /metrics reports the requests in flight and the latency percentiles,
+    in ms, of the last latency_window ones, along with the metrics of
+    segment if it has any. Each box of a boxes request, see
+    SegmentationClient.segment_boxes, counts as one request there.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self, address, segment=grabcut, max_images=16, latency_window=1000
+    ):
+        super(SegmentationServer, self).__init__(
+            address, SegmentationRequestHandler
+        )
+        self.segment = segment
+        self.max_images = max_images
+        self._images = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._in_flight = 0
+        self._requests = 0
+        self._failures = 0
+
+    def segment_boxes(self, img, boxes):
+        """Yields (index, points) of each box of img, as they are ready.
+
+        points is the exception raised for boxes that failed. The boxes are
+        segmented concurrently if segment has a submit method, like
+        SegmentationQueue, and one after the other otherwise.
+        """
+        if hasattr(self.segment, "submit"):
+            futures = {
+                self.segment.submit(img, box): index
+                for index, box in enumerate(boxes)
+            }
+            for future in concurrent.futures.as_completed(futures):
+                if future.exception() is not None:
+                    yield futures[future], future.exception()
+                else:
+                    yield futures[future], future.result()
+            return
+        for index, box in enumerate(boxes):
+            try:
+                points = self.segment(img, box)
+            except Exception as e:
+                points = e
+            yield index, points
+
+    def request_started(self):
+        with self._lock:
+            self._in_flight += 1
+        return time.monotonic()
+
+    def request_finished(self, start, failed=False):
+        latency = (time.monotonic() - start) * 1000
+        with self._lock:
+            self._in_flight -= 1
+            self._requests += 1
+            self._failures += failed
+            self._latencies.append(latency)
+
+    def metrics(self):
+        with self._lock:
+            metrics = {
+                "in_flight": self._in_flight,
+                "requests": self._requests,
+                "failures": self._failures,
+                "latency_ms": _percentiles(list(self._latencies)),
+            }
+        if hasattr(self.segment, "metrics"):
+            metrics.update(self.segment.metrics())
+        return metrics
+
+    def store(self, image_id, img):
+        with self._lock:
+            self._images[image_id] = img
+            self._images.move_to_end(image_id)
+            while len(self._images) > self.max_images:
+                self._images.popitem(last=False)
+
+    def image(self, image_id):
+        with self._lock:
+            if image_id in self._images:
+                self._images.move_to_end(image_id)
+            return self._images.get(image_id)
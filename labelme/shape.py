@@ -1,15 +1,10 @@
 import copy
 import math
 
+import numpy as np
 from qtpy import QtCore
 from qtpy import QtGui
 
-import labelme.utils
-
-
-# TODO(unknown):
-# - [opt] Store paths instead of creating new ones at each paint.
-
 
 DEFAULT_LINE_COLOR = QtGui.QColor(0, 255, 0, 128)  # bf hovering
 DEFAULT_FILL_COLOR = QtGui.QColor(0, 255, 0, 128)  # hovering
@@ -20,6 +15,18 @@ DEFAULT_HVERTEX_FILL_COLOR = QtGui.QColor(255, 255, 255, 255)  # hovering
 
 
 class Shape(object):
+    """Labeled shape, drawn with paths that are cached until it changes.
+
+    The paths and the bounding rect are only rebuilt after the points, the
+    shape type or whether it is closed change through the methods below,
+    or assigning points, and the vertices after the scale, point settings
+    or highlighted vertex change.
+
+    The vertices are stored in an (N, 2) float array, see array, and points
+    gives them as a list of QPointF for the code that works with those.
+    Polygons may have holes, which move with the shape, see
+    dropOutsideHoles for edits of the outline.
+    """
 
     # Render handles as squares
     P_SQUARE = 0
@@ -52,9 +59,14 @@ class Shape(object):
         flags=None,
         group_id=None,
     ):
+        # name: QPainterPath or QRectF, see _invalidate
+        self._cache = {}
+        # incremented whenever the geometry changes
+        self._version = 0
         self.label = label
         self.group_id = group_id
-        self.points = []
+        self._array = np.empty((0, 2))
+        self._holes = []
         self.fill = False
         self.selected = False
         self.shape_type = shape_type
@@ -96,35 +108,139 @@ class Shape(object):
         ]:
             raise ValueError("Unexpected shape_type: {}".format(value))
         self._shape_type = value
+        self._invalidate()
+
+    @property
+    def points(self):
+        """The vertices as a list of QPointF, cached.
+
+        Changing the list does not change the shape, assign points or use
+        the methods below instead.
+        """
+        if "points" not in self._cache:
+            self._cache["points"] = [
+                QtCore.QPointF(x, y) for x, y in self._array.tolist()
+            ]
+        return self._cache["points"]
+
+    @points.setter
+    def points(self, value):
+        # a copy, so that shapes never share the array they are cached for
+        if isinstance(value, np.ndarray):
+            array = np.array(value, dtype=float)
+        else:
+            array = np.array([(p.x(), p.y()) for p in value], dtype=float)
+        self._array = array.reshape(-1, 2)
+        self._invalidate()
+
+    @property
+    def holes(self):
+        """Rings cut out of a polygon, as read-only (N, 2) float arrays."""
+        holes = []
+        for hole in self._holes:
+            hole = hole.view()
+            hole.flags.writeable = False
+            holes.append(hole)
+        return holes
+
+    @holes.setter
+    def holes(self, value):
+        self._holes = [
+            np.array(hole, dtype=float).reshape(-1, 2) for hole in value
+        ]
+        self._invalidate()
+
+    def dropOutsideHoles(self):
+        """Drop the holes an edit of the outline left outside of it.
+
+        Not done by the edits themselves, so that a vertex dragged across a
+        hole and back keeps it: call it once the edit is done.
+        """
+        if not self._holes:
+            return
+        outline = QtGui.QPolygonF(self.points)
+        holes = [
+            hole
+            for hole in self._holes
+            if all(
+                outline.containsPoint(
+                    QtCore.QPointF(x, y), QtCore.Qt.OddEvenFill
+                )
+                for x, y in hole.tolist()
+            )
+        ]
+        if len(holes) != len(self._holes):
+            self._holes = holes
+            self._invalidate()
+
+    def _addHoles(self, path):
+        if self.shape_type != "polygon":
+            return
+        for hole in self._holes:
+            path.addPolygon(
+                QtGui.QPolygonF(
+                    [QtCore.QPointF(x, y) for x, y in hole.tolist()]
+                )
+            )
+            path.closeSubpath()
+
+    @property
+    def array(self):
+        """The vertices as a read-only (N, 2) float array."""
+        array = self._array.view()
+        array.flags.writeable = False
+        return array
+
+    def _invalidate(self):
+        """Drop the cached paths, once the geometry changed."""
+        self._cache.clear()
+        self._version += 1
+
+    def __getstate__(self):
+        # QPainterPath cannot be copied, the copy rebuilds them
+        state = self.__dict__.copy()
+        state["_cache"] = {}
+        return state
 
     def close(self):
         self._closed = True
+        self._invalidate()
 
     def addPoint(self, point):
-        if self.points and point == self.points[0]:
+        if len(self) and (point.x(), point.y()) == tuple(self._array[0]):
             self.close()
         else:
-            self.points.append(point)
+            self.insertPoint(len(self), point)
 
     def canAddPoint(self):
         return self.shape_type in ["polygon", "linestrip"]
 
     def popPoint(self):
-        if self.points:
-            return self.points.pop()
+        if len(self):
+            point = self[-1]
+            self._array = self._array[:-1]
+            self._invalidate()
+            return point
         return None
 
     def insertPoint(self, i, point):
-        self.points.insert(i, point)
+        points = self._cache.get("points")
+        self._array = np.insert(self._array, i, (point.x(), point.y()), 0)
+        self._invalidate()
+        if points is not None and i == len(points):
+            # appended, the cached points only need the new one
+            self._cache["points"] = points + [QtCore.QPointF(point)]
 
     def removePoint(self, i):
-        self.points.pop(i)
+        self._array = np.delete(self._array, i, 0)
+        self._invalidate()
 
     def isClosed(self):
         return self._closed
 
     def setOpen(self):
         self._closed = False
+        self._invalidate()
 
     def getRectFromLine(self, pt1, pt2):
         x1, y1 = pt1.x(), pt1.y()
@@ -141,44 +257,15 @@ class Shape(object):
             pen.setWidth(max(1, int(round(2.0 / self.scale))))
             painter.setPen(pen)
 
-            line_path = QtGui.QPainterPath()
-            vrtx_path = QtGui.QPainterPath()
-
-            if self.shape_type == "rectangle":
-                assert len(self.points) in [1, 2]
-                if len(self.points) == 2:
-                    rectangle = self.getRectFromLine(*self.points)
-                    line_path.addRect(rectangle)
-                for i in range(len(self.points)):
-                    self.drawVertex(vrtx_path, i)
-            elif self.shape_type == "circle":
-                assert len(self.points) in [1, 2]
-                if len(self.points) == 2:
-                    rectangle = self.getCircleRectFromLine(self.points)
-                    line_path.addEllipse(rectangle)
-                for i in range(len(self.points)):
-                    self.drawVertex(vrtx_path, i)
-            elif self.shape_type == "linestrip":
-                line_path.moveTo(self.points[0])
-                for i, p in enumerate(self.points):
-                    line_path.lineTo(p)
-                    self.drawVertex(vrtx_path, i)
-            else:
-                line_path.moveTo(self.points[0])
-                # Uncommenting the following line will draw 2 paths
-                # for the 1st vertex, and make it non-filled, which
-                # may be desirable.
-                # self.drawVertex(vrtx_path, 0)
-
-                for i, p in enumerate(self.points):
-                    line_path.lineTo(p)
-                    self.drawVertex(vrtx_path, i)
-                if self.isClosed():
-                    line_path.lineTo(self.points[0])
+            line_path = self.linePath()
+            vrtx_path = self.vertexPath()
 
             painter.drawPath(line_path)
             painter.drawPath(vrtx_path)
-            painter.fillPath(vrtx_path, self._vertex_fill_color)
+            if self._highlightIndex is not None:
+                painter.fillPath(vrtx_path, self.hvertex_fill_color)
+            else:
+                painter.fillPath(vrtx_path, self.vertex_fill_color)
             if self.fill:
                 color = (
                     self.select_fill_color
@@ -187,10 +274,71 @@ class Shape(object):
                 )
                 painter.fillPath(line_path, color)
 
+    def paintKey(self):
+        """Equal keys for as long as paint draws the shape the same."""
+        return (
+            self._version,
+            self.scale,
+            self.point_size,
+            self.point_type,
+            self.selected,
+            self.fill,
+            self._highlightIndex,
+            self._highlightMode,
+            self.line_color,
+            self.fill_color,
+            self.select_line_color,
+            self.select_fill_color,
+            self.vertex_fill_color,
+            self.hvertex_fill_color,
+        )
+
+    def linePath(self):
+        """Outline of the shape as drawn, cached."""
+        if "line_path" in self._cache:
+            return self._cache["line_path"]
+        line_path = QtGui.QPainterPath()
+        if self.shape_type == "rectangle":
+            assert len(self.points) in [1, 2]
+            if len(self.points) == 2:
+                rectangle = self.getRectFromLine(*self.points)
+                line_path.addRect(rectangle)
+        elif self.shape_type == "circle":
+            assert len(self.points) in [1, 2]
+            if len(self.points) == 2:
+                rectangle = self.getCircleRectFromLine(self.points)
+                line_path.addEllipse(rectangle)
+        elif self.points:
+            line_path.moveTo(self.points[0])
+            for p in self.points:
+                line_path.lineTo(p)
+            if self.shape_type != "linestrip" and self.isClosed():
+                line_path.lineTo(self.points[0])
+                self._addHoles(line_path)
+        self._cache["line_path"] = line_path
+        return line_path
+
+    def vertexPath(self):
+        """Handles of the vertices at the current scale, cached."""
+        key = (
+            self.scale,
+            self.point_size,
+            self.point_type,
+            self._highlightIndex,
+            self._highlightMode,
+        )
+        cached = self._cache.get("vertex_path")
+        if cached is None or cached[0] != key:
+            path = QtGui.QPainterPath()
+            for i in range(len(self.points)):
+                self.drawVertex(path, i)
+            cached = self._cache["vertex_path"] = (key, path)
+        return cached[1]
+
     def drawVertex(self, path, i):
         d = self.point_size / self.scale
         shape = self.point_type
-        point = self.points[i]
+        point = self[i]
         if i == self._highlightIndex:
             size, shape = self._highlightSettings[self._highlightMode]
             d *= size
@@ -206,25 +354,25 @@ class Shape(object):
             assert False, "unsupported vertex shape"
 
     def nearestVertex(self, point, epsilon):
-        min_distance = float("inf")
-        min_i = None
-        for i, p in enumerate(self.points):
-            dist = labelme.utils.distance(p - point)
-            if dist <= epsilon and dist < min_distance:
-                min_distance = dist
-                min_i = i
-        return min_i
+        if not len(self):
+            return None
+        dist = np.hypot(*(self._array - (point.x(), point.y())).T)
+        i = int(np.argmin(dist))
+        return i if dist[i] <= epsilon else None
 
     def nearestEdge(self, point, epsilon):
-        min_distance = float("inf")
-        post_i = None
-        for i in range(len(self.points)):
-            line = [self.points[i - 1], self.points[i]]
-            dist = labelme.utils.distancetoline(point, line)
-            if dist <= epsilon and dist < min_distance:
-                min_distance = dist
-                post_i = i
-        return post_i
+        """Index i of the nearest edge, from vertex i - 1 to vertex i."""
+        if not len(self):
+            return None
+        p = np.array([point.x(), point.y()])
+        start = np.roll(self._array, 1, axis=0)
+        edge = self._array - start
+        length = (edge * edge).sum(axis=1)
+        t = ((p - start) * edge).sum(axis=1) / np.maximum(length, 1e-12)
+        nearest = start + np.clip(t, 0, 1)[:, None] * edge
+        dist = np.hypot(*(nearest - p).T)
+        i = int(np.argmin(dist))
+        return i if dist[i] <= epsilon else None
 
     def containsPoint(self, point):
         return self.makePath().contains(point)
@@ -240,6 +388,9 @@ class Shape(object):
         return rectangle
 
     def makePath(self):
+        """Path of the shape for hit tests, cached: do not modify it."""
+        if "path" in self._cache:
+            return self._cache["path"]
         if self.shape_type == "rectangle":
             path = QtGui.QPainterPath()
             if len(self.points) == 2:
@@ -254,16 +405,31 @@ class Shape(object):
             path = QtGui.QPainterPath(self.points[0])
             for p in self.points[1:]:
                 path.lineTo(p)
+            self._addHoles(path)
+        self._cache["path"] = path
         return path
 
     def boundingRect(self):
-        return self.makePath().boundingRect()
+        if "bounding_rect" not in self._cache:
+            self._cache["bounding_rect"] = self.makePath().boundingRect()
+        return QtCore.QRectF(self._cache["bounding_rect"])
 
     def moveBy(self, offset):
-        self.points = [p + offset for p in self.points]
+        self._array += (offset.x(), offset.y())
+        for hole in self._holes:
+            hole += (offset.x(), offset.y())
+        self._cache.pop("points", None)
+        self._version += 1
+        # the same paths, only moved
+        for name in ["line_path", "path", "bounding_rect"]:
+            if name in self._cache:
+                self._cache[name].translate(offset)
+        if "vertex_path" in self._cache:
+            self._cache["vertex_path"][1].translate(offset)
 
     def moveVertexBy(self, i, offset):
-        self.points[i] = self.points[i] + offset
+        self._array[i] += (offset.x(), offset.y())
+        self._invalidate()
 
     def highlightVertex(self, i, action):
         """Highlight a vertex appropriately based on the current action
@@ -284,10 +450,11 @@ class Shape(object):
         return copy.deepcopy(self)
 
     def __len__(self):
-        return len(self.points)
+        return len(self._array)
 
     def __getitem__(self, key):
         return self.points[key]
 
     def __setitem__(self, key, value):
-        self.points[key] = value
+        self._array[key] = (value.x(), value.y())
+        self._invalidate()
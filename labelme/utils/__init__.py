@@ -15,6 +15,7 @@ from .shape import masks_to_bboxes
 from .shape import polygons_to_mask
 from .shape import shape_to_mask
 from .shape import shapes_to_label
+from .shape import simplify_polygon
 
 from .qt import newIcon
 from .qt import newButton
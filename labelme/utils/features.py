@@ -0,0 +1,54 @@
+import threading
+
+import cv2
+
+
+class ImagePyramid(object):
+    """Successively halved copies of an image, built on first use."""
+
+    def __init__(self, img):
+        self._levels = [img]
+        self._lock = threading.Lock()
+
+    def __getitem__(self, level):
+        with self._lock:
+            while len(self._levels) <= level:
+                self._levels.append(cv2.pyrDown(self._levels[-1]))
+            return self._levels[level]
+
+
+class ImageFeatures(object):
+    """Images derived from a loaded image, computed once and cached.
+
+    Only the pyramid of the pyramid wand method is kept so far. start()
+    builds its levels in a background thread right after the image is
+    loaded; reading a level that is not ready yet computes it on the
+    calling thread instead, so callers never have to check.
+    """
+
+    def __init__(self, img):
+        self.img = img
+        self.pyramid = ImagePyramid(img)
+        self._cancelled = False
+        self._thread = None
+
+    def compute(self, pyramid_depth):
+        for level in range(1, pyramid_depth + 1):
+            if self._cancelled:
+                return
+            self.pyramid[level]
+
+    def start(self, pyramid_depth):
+        """Build the pyramid levels up to pyramid_depth in a thread."""
+        self._thread = threading.Thread(
+            target=self.compute, args=(pyramid_depth,), daemon=True
+        )
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def cancel(self):
+        """Stop the background thread after the level it is computing."""
+        self._cancelled = True
@@ -69,6 +69,8 @@ def shapes_to_label(img_shape, shapes, label_name_to_value):
         cls_id = label_name_to_value[cls_name]
 
         mask = shape_to_mask(img_shape[:2], points, shape_type)
+        for hole in shape.get("holes", []):
+            mask &= ~shape_to_mask(img_shape[:2], hole)
         cls[mask] = cls_id
         ins[mask] = ins_id
 
@@ -110,3 +112,130 @@ def masks_to_bboxes(masks):
         bboxes.append((y1, x1, y2, x2))
     bboxes = np.asarray(bboxes, dtype=np.float32)
     return bboxes
+
+
+def _segment_distances(points, a, b):
+    ab = b - a
+    length2 = float(np.dot(ab, ab))
+    if length2 == 0:
+        return np.hypot(*(points - a).T)
+    t = np.clip(np.dot(points - a, ab) / length2, 0, 1)
+    return np.hypot(*(points - a - t[:, None] * ab).T)
+
+
+def _simplification_ranks(points):
+    """Douglas-Peucker importance of each vertex of a closed polygon.
+
+    Keeping the vertices whose rank is above tolerance gives the
+    Douglas-Peucker simplification of the polygon for that tolerance, and
+    keeping the n highest ranked ones gives the one for the tolerance that
+    leaves n vertices.
+    """
+    n = len(points)
+    ranks = np.zeros(n)
+    ring = np.vstack([points, points[:1]])
+    # split the ring at the first vertex and the one farthest from it
+    far = int(np.argmax(_segment_distances(points, points[0], points[0])))
+    ranks[0] = ranks[far] = np.inf
+    stack = [(0, far, np.inf), (far, n, np.inf)]
+    while stack:
+        i, j, parent = stack.pop()
+        if j - i < 2:
+            continue
+        distances = _segment_distances(ring[i + 1 : j], ring[i], ring[j])
+        k = i + 1 + int(np.argmax(distances))
+        # a vertex is only reached if its parent segment was split
+        ranks[k] = min(distances[k - i - 1], parent)
+        stack += [(i, k, ranks[k]), (k, j, ranks[k])]
+    return ranks
+
+
+def _crossing_edges(ring, chunk_size=1 << 20):
+    """Indices of the edges of the closed ring that cross another edge.
+
+    Only the pairs of edges whose bounding boxes overlap are tested, found
+    by sorting the edges along x, so that this is close to linear in the
+    ring size for the outlines of regions.
+    """
+    n = len(ring)
+    a = np.asarray(ring, dtype=np.float64)
+    b = np.roll(a, -1, axis=0)
+    lo, hi = np.minimum(a, b), np.maximum(a, b)
+
+    def orientation(p, q, r):
+        return (q[:, 0] - p[:, 0]) * (r[:, 1] - p[:, 1]) - (
+            q[:, 1] - p[:, 1]
+        ) * (r[:, 0] - p[:, 0])
+
+    order = np.argsort(lo[:, 0], kind="stable")
+    # the edges after the k-th in order that start before it ends along x
+    ends = np.searchsorted(lo[order, 0], hi[order, 0], side="right")
+    counts = np.maximum(ends - np.arange(n) - 1, 0)
+    cumulative = np.cumsum(counts)
+
+    crossing = set()
+    # in chunks of pairs, so that memory stays bounded
+    start = 0
+    while start < n:
+        stop = int(
+            np.searchsorted(
+                cumulative, cumulative[start] - counts[start] + chunk_size
+            )
+        )
+        stop = min(max(stop, start + 1), n)
+        k = np.repeat(np.arange(start, stop), counts[start:stop])
+        offsets = np.arange(len(k)) - np.repeat(
+            np.cumsum(counts[start:stop]) - counts[start:stop],
+            counts[start:stop],
+        )
+        i, j = order[k], order[k + 1 + offsets]
+        overlap = (lo[i, 1] <= hi[j, 1]) & (lo[j, 1] <= hi[i, 1])
+        i, j = i[overlap], j[overlap]
+        d1 = orientation(a[i], b[i], a[j])
+        d2 = orientation(a[i], b[i], b[j])
+        d3 = orientation(a[j], b[j], a[i])
+        d4 = orientation(a[j], b[j], b[i])
+        # proper crossings only, edges sharing a vertex merely touch
+        cross = (d1 * d2 < 0) & (d3 * d4 < 0)
+        crossing.update(i[cross].tolist())
+        crossing.update(j[cross].tolist())
+        start = stop
+    return sorted(crossing)
+
+
+def simplify_polygon(points, tolerance=1.0, max_vertices=None):
+    """Simplify a closed polygon with the Douglas-Peucker algorithm.
+
+    Vertices closer than tolerance pixels to the simplified outline are
+    dropped, keeping at most max_vertices of them if given. Vertices are
+    then put back where the simplified outline would cross itself, so it
+    stays a simple polygon if the original one is. Returns the kept points
+    as a (N, 2) array, in their original order.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if max_vertices is not None and max_vertices < 3:
+        raise ValueError("Unexpected max_vertices: {}".format(max_vertices))
+    n = len(points)
+    if n <= 3:
+        return points
+
+    ranks = _simplification_ranks(points)
+    order = np.argsort(-ranks, kind="stable")
+    count = max(int((ranks > tolerance).sum()), 3)
+    if max_vertices is not None:
+        count = min(count, max_vertices)
+    keep = np.zeros(n, dtype=bool)
+    keep[order[:count]] = True
+
+    while True:
+        kept = np.flatnonzero(keep)
+        restored = False
+        for edge in _crossing_edges(points[kept]):
+            i = kept[edge]
+            j = kept[(edge + 1) % len(kept)]
+            span = np.arange(i + 1, j if j > i else j + n) % n
+            if len(span):
+                keep[span[np.argmax(ranks[span])]] = True
+                restored = True
+        if not restored:
+            return points[keep]
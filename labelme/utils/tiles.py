@@ -0,0 +1,150 @@
+import collections
+import mmap
+import tempfile
+import threading
+
+import numpy as np
+import PIL.Image
+
+
+class TiledImage(object):
+    """Read-only image split into square tiles that are loaded on demand.
+
+    source is anything that can be sliced like an (H, W[, C]) array, such as
+    a numpy.memmap. Only the tiles covering the regions read from it are
+    kept in memory, at most max_tiles of them, dropping the least recently
+    used first.
+    """
+
+    def __init__(self, source, tile_size=512, max_tiles=64):
+        if tile_size < 1:
+            raise ValueError("Unexpected tile_size: {}".format(tile_size))
+        self.source = source
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self._tiles = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, filename, tile_size=512, max_tiles=64):
+        """Read an image file as BGR, like cv2.imread, into a TiledImage.
+
+        Uncompressed RGB files (TIFF, BMP, PPM) are mapped with numpy.memmap
+        as they are, so only the tiles in use are ever read. Other formats
+        cannot be decoded in parts: PIL decodes them whole once, and the
+        pixels are written in strips to an unlinked temporary file mapped
+        back with numpy.memmap, after which only the tiles in use stay in
+        memory.
+        """
+        with PIL.Image.open(filename) as pil:
+            source = cls._map_raw(filename, pil)
+            if source is not None:
+                return cls(source, tile_size=tile_size, max_tiles=max_tiles)
+            w, h = pil.size
+            source = np.memmap(
+                tempfile.TemporaryFile(),
+                dtype=np.uint8,
+                mode="w+",
+                shape=(h, w, 3),
+            )
+            # in strips, so that the converted pixels are never all in
+            # memory next to the decoded ones
+            for y in range(0, h, tile_size):
+                strip = pil.crop((0, y, w, min(y + tile_size, h)))
+                if strip.mode != "RGB":
+                    strip = strip.convert("RGB")
+                strip = np.asarray(strip)
+                source[y : y + len(strip)] = strip[:, :, ::-1]
+        source.flush()
+        mapping = getattr(source, "_mmap", None)
+        if mapping is not None and hasattr(mmap, "MADV_DONTNEED"):
+            # the written pages are now on disk, let them go
+            mapping.madvise(mmap.MADV_DONTNEED)
+        return cls(source, tile_size=tile_size, max_tiles=max_tiles)
+
+    @staticmethod
+    def _map_raw(filename, pil):
+        """BGR view of the pixels of an uncompressed file, None if not one."""
+        if len(pil.tile) != 1:
+            return None
+        codec, extents, offset, args = pil.tile[0]
+        w, h = pil.size
+        if codec != "raw" or tuple(extents) != (0, 0, w, h):
+            return None
+        if not isinstance(args, tuple):
+            args = (args, 0, 1)
+        rawmode, stride, ystep = args
+        # rows may be padded, as in BMP
+        stride = stride or w * 3
+        if rawmode not in ["RGB", "BGR"] or stride < w * 3:
+            return None
+        rows = np.memmap(
+            filename,
+            dtype=np.uint8,
+            mode="r",
+            offset=offset,
+            shape=(h, stride),
+        )
+        source = np.lib.stride_tricks.as_strided(
+            rows, shape=(h, w, 3), strides=(stride, 3, 1), writeable=False
+        )
+        if ystep < 0:
+            # stored bottom-up
+            source = source[::-1]
+        if rawmode == "RGB":
+            source = source[:, :, ::-1]
+        return source
+
+    @property
+    def shape(self):
+        return self.source.shape
+
+    @property
+    def dtype(self):
+        return self.source.dtype
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def _tile(self, i, j):
+        with self._lock:
+            if (i, j) in self._tiles:
+                self._tiles.move_to_end((i, j))
+                return self._tiles[(i, j)]
+        size = self.tile_size
+        tile = np.array(
+            self.source[i * size : (i + 1) * size, j * size : (j + 1) * size]
+        )
+        with self._lock:
+            self._tiles[(i, j)] = tile
+            while len(self._tiles) > max(self.max_tiles, 1):
+                self._tiles.popitem(last=False)
+        return tile
+
+    def __getitem__(self, key):
+        """Copy of a region, for key a pair of slices with unit steps."""
+        if not isinstance(key, tuple) or len(key) != 2:
+            raise ValueError("Unexpected TiledImage key: {}".format(key))
+        (r0, r1, rstep), (c0, c1, cstep) = (
+            key[0].indices(self.shape[0]),
+            key[1].indices(self.shape[1]),
+        )
+        if rstep != 1 or cstep != 1:
+            raise ValueError("Unexpected TiledImage key: {}".format(key))
+        r1, c1 = max(r0, r1), max(c0, c1)
+        region = np.empty((r1 - r0, c1 - c0) + self.shape[2:], self.dtype)
+        size = self.tile_size
+        for i in range(r0 // size, (r1 + size - 1) // size):
+            for j in range(c0 // size, (c1 + size - 1) // size):
+                y0, y1 = max(r0, i * size), min(r1, (i + 1) * size)
+                x0, x1 = max(c0, j * size), min(c1, (j + 1) * size)
+                region[y0 - r0 : y1 - r0, x0 - c0 : x1 - c0] = self._tile(
+                    i, j
+                )[y0 - i * size : y1 - i * size, x0 - j * size : x1 - j * size]
+        return region
+
+    def __array__(self, dtype=None):
+        # the whole image, only for code that needs a plain array
+        region = self[:, :]
+        return region if dtype is None else region.astype(dtype)
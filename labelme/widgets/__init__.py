@@ -14,6 +14,8 @@ from .label_dialog import LabelQLineEdit
 from .label_list_widget import LabelListWidget
 from .label_list_widget import LabelListWidgetItem
 
+from .tolerance_widget import ToleranceWidget
+
 from .tool_bar import ToolBar
 
 from .unique_label_qlist_widget import UniqueLabelQListWidget
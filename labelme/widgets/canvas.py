@@ -1,19 +1,19 @@
-import json
 import math
-import os
 import random
-import cv2
 import shapely
 
 import numpy as np
-import requests
 from qtpy import QtCore
 from qtpy import QtGui
 from qtpy import QtWidgets
 
 from labelme import QT5
+from labelme.logger import logger
+from labelme.segmentation import create_client
+from labelme.segmentation import SegmentationWorker
 from labelme.shape import Shape
 import labelme.utils
+from labelme.widgets.shape_index import ShapeIndex
 
 
 # TODO(unknown):
@@ -29,6 +29,16 @@ CURSOR_GRAB = QtCore.Qt.OpenHandCursor
 MOVE_SPEED = 5.0
 
 
+def _overlap(rect, other):
+    # unlike QRectF.intersects, true for the empty rects of points and lines
+    return not (
+        rect.right() < other.left()
+        or rect.left() > other.right()
+        or rect.bottom() < other.top()
+        or rect.top() > other.bottom()
+    )
+
+
 class Canvas(QtWidgets.QWidget):
 
     zoomRequest = QtCore.Signal(int, QtCore.QPoint)
@@ -67,9 +77,17 @@ class Canvas(QtWidgets.QWidget):
                 "linestrip": False,
             },
         )
+        # keyword arguments of create_client
+        segmentation = kwargs.pop("segmentation", {})
+        # Shift-clicks less than this many ms apart are filled as one batch
+        self._magicWandBatchInterval = kwargs.pop(
+            "magic_wand_batch_interval", 0
+        )
         super(Canvas, self).__init__(*args, **kwargs)
         # Initialise local state.
         self.mode = self.EDIT
+        # bounding rects of the shapes, for hit tests, see _shapesAt
+        self.shapeIndex = ShapeIndex()
         self.shapes = []
         self.shapesBackups = []
         self.current = None
@@ -99,6 +117,9 @@ class Canvas(QtWidgets.QWidget):
         self.snapping = True
         self.hShapeIsSelected = False
         self._painter = QtGui.QPainter()
+        # (key, rect, pixmap) of the shapes drawn under the dragged ones
+        self._layer = None
+        self.dragging = False
         self._cursor = CURSOR_DEFAULT
         # Menus:
         # 0: right-click without selection and dragging of shapes
@@ -109,10 +130,158 @@ class Canvas(QtWidgets.QWidget):
         self.setFocusPolicy(QtCore.Qt.WheelFocus)
         self.imageFilename = None
         self.imageMagicWand = None
+        self.imageFeatures = None
         self.imageSelectionWindow = None
         self.labeling_image = False
         self.api_points = None
         self.center = None
+        self._magicWandSeeds = []
+        # number of shapes added by the last finalise, more than one for the
+        # separate regions of a magic wand selection
+        self.lastShapesCount = 1
+        self._magicWandTimer = QtCore.QTimer(self)
+        self._magicWandTimer.setSingleShot(True)
+        self._magicWandTimer.timeout.connect(self.flushMagicWand)
+        # segmentation requests for the box, see segmentBox
+        self.segmentation = SegmentationWorker(
+            create_client(**segmentation),
+            max_workers=segmentation.get("pool_size", 2),
+            parent=self,
+        )
+        self.segmentation.finished.connect(self._segmentationFinished)
+        self.segmentation.failed.connect(self._segmentationFailed)
+        self._segmentationRequest = None
+        # boxes drawn with Ctrl, segmented together by segmentPendingBoxes
+        # and labeled later, see openPendingBox
+        self.pendingBoxes = []
+        self.boxSegmentation = SegmentationWorker(
+            self.segmentation.client, max_workers=1, parent=self
+        )
+        self.boxSegmentation.segmented.connect(self._pendingBoxSegmented)
+        self.boxSegmentation.finished.connect(self._pendingBoxesFinished)
+        self.boxSegmentation.failed.connect(self._pendingBoxesFailed)
+        self._pendingBoxesRequest = None
+        self._pendingBoxesSent = []
+
+    @property
+    def shapes(self):
+        return self._shapes
+
+    @shapes.setter
+    def shapes(self, value):
+        self._shapes = value
+        # rebuilt on the next hit test, changes in place are applied to
+        # shapeIndex as they are made
+        self._shapeIndexDirty = True
+
+    def _shapesAt(self, pos, margin=0):
+        """Visible shapes within margin of pos, the last drawn first."""
+        if self._shapeIndexDirty:
+            self.shapeIndex.rebuild(self._shapes)
+            self._shapeIndexDirty = False
+        return [
+            shape
+            for shape in self.shapeIndex.query(pos.x(), pos.y(), margin)
+            if self.isVisible(shape)
+        ]
+
+    def _widgetRect(self, rect, margin=0):
+        """Widget rect covering rect of the image, and margin pixels more."""
+        offset = self.offsetToCenter()
+        rect = QtCore.QRectF(
+            (rect.topLeft() + offset) * self.scale,
+            (rect.bottomRight() + offset) * self.scale,
+        ).toAlignedRect()
+        return rect.adjusted(-margin, -margin, margin, margin)
+
+    def _imageRect(self, rect):
+        """Rect of the image shown in rect of the widget."""
+        offset = self.offsetToCenter()
+        rect = QtCore.QRectF(rect)
+        return QtCore.QRectF(
+            rect.topLeft() / self.scale - offset,
+            rect.bottomRight() / self.scale - offset,
+        )
+
+    def _shapeMargin(self):
+        # pixels drawn around the bounding rects: the highlighted vertices
+        # are up to 4 times larger, and the pens a few pixels wide
+        return 2 * Shape.point_size + 4
+
+    def shapesRegion(self, shapes):
+        """Region of the widget where shapes are drawn."""
+        region = QtGui.QRegion()
+        if not self.pixmap:
+            return region
+        for shape in shapes:
+            if shape is not None and len(shape):
+                region += self._widgetRect(
+                    shape.boundingRect(), self._shapeMargin()
+                )
+        return region
+
+    def staticLayer(self, shapes):
+        """Pixmap of shapes over the visible part of the canvas, cached.
+
+        The pixmap is drawn again only when the shapes or how they look
+        change, or the zoom or the visible part of the canvas.
+        """
+        rect = self.visibleRegion().boundingRect()
+        if rect.isEmpty():
+            return rect, None
+        ratio = self.devicePixelRatioF()
+        key = (
+            rect,
+            ratio,
+            self.scale,
+            self.offsetToCenter(),
+            [(shape, shape.paintKey()) for shape in shapes],
+        )
+        if self._layer is not None and self._layer[0] == key:
+            return self._layer[1:]
+
+        layer = QtGui.QPixmap(rect.size() * ratio)
+        layer.setDevicePixelRatio(ratio)
+        layer.fill(QtCore.Qt.transparent)
+        p = QtGui.QPainter(layer)
+        p.setRenderHint(QtGui.QPainter.Antialiasing)
+        p.setRenderHint(QtGui.QPainter.HighQualityAntialiasing)
+        # the same transform as in paintEvent, from the corner of rect
+        p.translate(-QtCore.QPointF(rect.topLeft()))
+        p.scale(self.scale, self.scale)
+        p.translate(self.offsetToCenter())
+        margin = self._shapeMargin()
+        shown = self._imageRect(
+            rect.adjusted(-margin, -margin, margin, margin)
+        )
+        for shape in shapes:
+            if _overlap(shape.boundingRect(), shown):
+                shape.paint(p)
+        p.end()
+        self._layer = (key, rect, layer)
+        return rect, layer
+
+    def drawsCrosshair(self):
+        return (
+            (self._createMode == "box" or self._crosshair[self._createMode])
+            and self.drawing()
+            and self.prevMovePoint
+            and not self.outOfPixmap(self.prevMovePoint)
+        )
+
+    def crosshairRegion(self):
+        """Region of the widget where the crosshair is drawn, if it is."""
+        region = QtGui.QRegion()
+        if not self.pixmap or not self.drawsCrosshair():
+            return region
+        offset = self.offsetToCenter()
+        x = int((int(self.prevMovePoint.x()) + offset.x()) * self.scale)
+        y = int((int(self.prevMovePoint.y()) + offset.y()) * self.scale)
+        # the pen is one pixel of the image wide
+        margin = int(self.scale / 2) + 2
+        region += QtCore.QRect(0, y - margin, self.width(), 2 * margin + 1)
+        region += QtCore.QRect(x - margin, 0, 2 * margin + 1, self.height())
+        return region
 
     def fillDrawing(self):
         return self._fill_drawing
@@ -195,6 +364,7 @@ class Canvas(QtWidgets.QWidget):
         return self.mode == self.LABEL
 
     def setEditing(self, value=True):
+        self.cancelSegmentation()
         self.mode = self.EDIT if value else self.CREATE
         if self.mode == self.EDIT:
             # CREATE -> EDIT
@@ -207,7 +377,7 @@ class Canvas(QtWidgets.QWidget):
     def unHighlight(self):
         if self.hShape:
             self.hShape.highlightClear()
-            self.update()
+            self.update(self.shapesRegion([self.hShape]))
         self.prevhShape = self.hShape
         self.prevhVertex = self.hVertex
         self.prevhEdge = self.hEdge
@@ -229,6 +399,8 @@ class Canvas(QtWidgets.QWidget):
         except AttributeError:
             return
 
+        # only the parts of the canvas that change are repainted
+        crosshair = self.crosshairRegion()
         self.prevMovePoint = pos
         self.restoreCursor()
 
@@ -241,9 +413,10 @@ class Canvas(QtWidgets.QWidget):
 
             self.overrideCursor(CURSOR_DRAW)
             if not self.current:
-                self.repaint()  # draw crosshair
+                self.repaint(crosshair + self.crosshairRegion())
                 return
 
+            region = self.shapesRegion([self.current, self.line])
             if self.outOfPixmap(pos):
                 # Don't allow the user to draw outside the pixmap.
                 # Project the point to the pixmap's edges.
@@ -277,33 +450,47 @@ class Canvas(QtWidgets.QWidget):
             elif self.createMode == "point":
                 self.line.points = [self.current[0]]
                 self.line.close()
-            self.repaint()
+            self.repaint(
+                crosshair
+                + self.crosshairRegion()
+                + region
+                + self.shapesRegion([self.current, self.line])
+            )
             self.current.highlightClear()
             return
 
         # Polygon copy moving.
         if QtCore.Qt.RightButton & ev.buttons():
+            self.dragging = bool(self.selectedShapes)
             if self.selectedShapesCopy and self.prevPoint:
                 self.overrideCursor(CURSOR_MOVE)
+                region = self.shapesRegion(self.selectedShapesCopy)
                 self.boundedMoveShapes(self.selectedShapesCopy, pos)
-                self.repaint()
+                self.repaint(
+                    region + self.shapesRegion(self.selectedShapesCopy)
+                )
             elif self.selectedShapes:
                 self.selectedShapesCopy = [
                     s.copy() for s in self.selectedShapes
                 ]
-                self.repaint()
+                self.repaint(self.shapesRegion(self.selectedShapesCopy))
             return
 
         # Polygon/Vertex moving.
         if QtCore.Qt.LeftButton & ev.buttons():
+            self.dragging = self.selectedVertex() or bool(
+                self.selectedShapes and self.prevPoint
+            )
             if self.selectedVertex():
+                region = self.shapesRegion([self.hShape])
                 self.boundedMoveVertex(pos)
-                self.repaint()
+                self.repaint(region + self.shapesRegion([self.hShape]))
                 self.movingShape = True
             elif self.selectedShapes and self.prevPoint:
                 self.overrideCursor(CURSOR_MOVE)
+                region = self.shapesRegion(self.selectedShapes)
                 self.boundedMoveShapes(self.selectedShapes, pos)
-                self.repaint()
+                self.repaint(region + self.shapesRegion(self.selectedShapes))
                 self.movingShape = True
             return
 
@@ -312,7 +499,8 @@ class Canvas(QtWidgets.QWidget):
         # - Highlight vertex
         # Update shape/vertex fill and tooltip value accordingly.
         self.setToolTip(self.tr("Image"))
-        for shape in reversed([s for s in self.shapes if self.isVisible(s)]):
+        hShape = self.hShape
+        for shape in self._shapesAt(pos, self.epsilon / self.scale):
             # Look for a nearby vertex to highlight. If that fails,
             # check if we happen to be inside a shape.
             index = shape.nearestVertex(pos, self.epsilon / self.scale)
@@ -328,7 +516,7 @@ class Canvas(QtWidgets.QWidget):
                 self.overrideCursor(CURSOR_POINT)
                 self.setToolTip(self.tr("Click & drag to move point"))
                 self.setStatusTip(self.toolTip())
-                self.update()
+                self.update(self.shapesRegion([hShape, shape]))
                 break
             elif index_edge is not None and shape.canAddPoint():
                 if self.selectedVertex():
@@ -340,7 +528,7 @@ class Canvas(QtWidgets.QWidget):
                 self.overrideCursor(CURSOR_POINT)
                 self.setToolTip(self.tr("Click to create point"))
                 self.setStatusTip(self.toolTip())
-                self.update()
+                self.update(self.shapesRegion([hShape, shape]))
                 break
             elif shape.containsPoint(pos) and self.editing():
                 if self.selectedVertex():
@@ -355,7 +543,7 @@ class Canvas(QtWidgets.QWidget):
                 )
                 self.setStatusTip(self.toolTip())
                 self.overrideCursor(CURSOR_GRAB)
-                self.update()
+                self.update(self.shapesRegion([hShape, shape]))
                 # break
                 pass
         else:  # Nothing found, clear highlights, reset state.
@@ -370,6 +558,7 @@ class Canvas(QtWidgets.QWidget):
         if shape is None or index is None or point is None:
             return
         shape.insertPoint(index, point)
+        self.shapeIndex.update(shape)
         shape.highlightVertex(index, shape.MOVE_VERTEX)
         self.hShape = shape
         self.hVertex = index
@@ -382,6 +571,7 @@ class Canvas(QtWidgets.QWidget):
         if shape is None or index is None:
             return
         shape.removePoint(index)
+        self.shapeIndex.update(shape)
         shape.highlightClear()
         self.hShape = shape
         self.prevhVertex = None
@@ -449,6 +639,11 @@ class Canvas(QtWidgets.QWidget):
                         self.current.points = self.line.points
                         # print("rec current points:",self.current.points[0])
                         self.finalise()
+                    elif (
+                        self.createMode == "box"
+                        and int(ev.modifiers()) == QtCore.Qt.ControlModifier
+                    ):
+                        self.queueBox()
                     elif self.createMode == "box":
                         assert len(self.current.points) == 1
                         # print("current points before:",self.current.points[0])
@@ -461,16 +656,7 @@ class Canvas(QtWidgets.QWidget):
                         # self.finalise()
                         
                         # * HANDLE API *
-                        extension = os.path.splitext(self.imageFilename)[1]
-                        img_encode = cv2.imencode(extension, self.imageMagicWand)
-                        url = 'http://202.191.58.201/get_main_object'
-                        file = {'image': (self.imageFilename, img_encode[1])}
-                        form_data = {'x1': self.current.points[0].x(), 
-                                    'y1': self.current.points[0].y(), 
-                                    'x2': self.current.points[1].x(), 
-                                    'y2': self.current.points[1].y()}
-                        data = requests.post(url, files=file, data=form_data)
-                        self.api_points = json.loads(data.content.decode("utf-8"))["points"]
+                        self.segmentBox()
 
                         self.mode = self.LABEL
                     elif self.createMode == "linestrip":
@@ -478,9 +664,15 @@ class Canvas(QtWidgets.QWidget):
                         self.line[0] = self.current[-1]
                         if int(ev.modifiers()) == QtCore.Qt.ControlModifier:
                             self.finalise()
+                elif (
+                    self.createMode == "box"
+                    and self._pendingBoxAt(pos) is not None
+                ):
+                    self.openPendingBox(self._pendingBoxAt(pos))
                 elif not self.outOfPixmap(pos):
                     # Create new shape.
                     if self.createMode == "box":
+                        self.cancelSegmentation()
                         self.current = Shape(shape_type="rectangle")
                         self.labeling_image = False
                         self.api_points = None
@@ -496,7 +688,15 @@ class Canvas(QtWidgets.QWidget):
                         self.setHiding()
                         self.drawingPolygon.emit(True)
                         self.update()
+            elif (
+                self.labeling()
+                and self.current is None
+                and self._pendingBoxAt(pos) is not None
+            ):
+                self.openPendingBox(self._pendingBoxAt(pos))
             elif self.labeling():
+                if int(ev.modifiers()) != QtCore.Qt.ShiftModifier:
+                    self.flushMagicWand()
                 start_point = (self.imageSelectionWindow._ix, self.imageSelectionWindow._iy)
                 end_point = (self.imageSelectionWindow._x, self.imageSelectionWindow._y)
                 check_point = (pos.x(), pos.y())
@@ -522,18 +722,13 @@ class Canvas(QtWidgets.QWidget):
                         )
                     # self.setEditing()
                 else:
-                    self.current = Shape(shape_type="polygon")
-                    
                     if self.api_points and self.labeling_image == False:
-                        # new_api_points = []
-                        temp_x, temp_y = 0, 0
-                        for point in self.api_points:
-                            self.current.addPoint(QtCore.QPointF(point[0], point[1]))
-                            # new_api_points += [[self.imageSelectionWindow._ix + point[0], self.imageSelectionWindow._iy + point[1]]]
-                            temp_x += self.current.points[-1].x()
-                            temp_y += self.current.points[-1].y()
-                        self.center = [temp_x/len(self.api_points), temp_y/len(self.api_points)]
-                        # self.api_points = new_api_points
+                        self.current = Shape(shape_type="polygon")
+                        # all at once, addPoint copies the points each time
+                        self.current.points = [
+                            QtCore.QPointF(x, y) for x, y in self.api_points
+                        ]
+                        self.center = np.mean(self.api_points, axis=0).tolist()
                         
                         if len(self.current.points) >= 3:
                             self.current.addPoint(self.current.points[0])
@@ -545,36 +740,18 @@ class Canvas(QtWidgets.QWidget):
                         self.labeling_image = True
                             
                     if int(ev.modifiers()) == QtCore.Qt.ShiftModifier:
-                        if self.api_points:
-                            list_of_points = self.imageSelectionWindow._shift_key(int(pos.x()), int(pos.y()))
-                            current_polygon = shapely.geometry.Polygon(self.api_points)
-                            new_points = []
-                            
-                            for point in list_of_points:
-                                line = shapely.geometry.LineString([[self.center[0], self.center[1]], [point.x(), point.y()]])
-                                if line.intersects(current_polygon):
-                                    new_points += [[point.x(), point.y()]]
-                        
-                            current_contours = self.sort_contours(self.api_points + new_points, self.center)
-
-                            for point in current_contours:
-                                self.current.addPoint(QtCore.QPointF(point[0], point[1]))
-                        else:
-                            self.current.points = self.imageSelectionWindow._shift_key(int(pos.x()), int(pos.y()))
-                        
-                        if len(self.current.points) >= 3:
-                            self.current.addPoint(self.current.points[0])
-
-                        if self.current.isClosed():
-                            # print("Close!")
-                            self.update()
+                        # filled in flushMagicWand, together with the
+                        # Shift-clicks that follow in quick succession; the
+                        # current polygon stays until then
+                        self._magicWandSeeds.append(
+                            (int(pos.x()), int(pos.y()), True)
+                        )
+                        self._magicWandTimer.start(
+                            self._magicWandBatchInterval
+                        )
 
                         self.labeling_image = True
 
-                        if self.current.isClosed():
-                            # print("Close!")
-                            self.update()
-
                     elif int(ev.modifiers()) == QtCore.Qt.AltModifier:
                         if self.labeling_image == False:
                             msg = self.tr(
@@ -584,6 +761,7 @@ class Canvas(QtWidgets.QWidget):
                                 self, self.tr("Attention"), msg
                             )
                         else:
+                            self.current = Shape(shape_type="polygon")
                             if self.api_points:
                                 list_of_points = self.imageSelectionWindow._alt_key(int(pos.x()), int(pos.y()))
                                 current_polygon = shapely.geometry.Polygon(self.api_points)
@@ -596,8 +774,10 @@ class Canvas(QtWidgets.QWidget):
                             
                                 current_contours = self.sort_contours(self.api_points + new_points, self.center)
 
-                                for point in current_contours:
-                                    self.current.addPoint(QtCore.QPointF(point[0], point[1]))
+                                self.current.points = [
+                                    QtCore.QPointF(x, y)
+                                    for x, y in current_contours
+                                ]
                             else:
                                 self.current.points = self.imageSelectionWindow._alt_key(int(pos.x()), int(pos.y()))
                             
@@ -632,7 +812,227 @@ class Canvas(QtWidgets.QWidget):
                 self.repaint()
             self.prevPoint = pos
 
+    def segmentBox(self):
+        """Request the API polygon of the box just drawn, off the GUI thread.
+
+        The polygon is used if it arrives before the first click in the box,
+        see _segmentationFinished.
+        """
+        self.api_points = None
+        box = (
+            self.current.points[0].x(),
+            self.current.points[0].y(),
+            self.current.points[1].x(),
+            self.current.points[1].y(),
+        )
+        self._segmentationRequest = self.segmentation.submit(
+            self.imageMagicWand, self.imageFilename, box
+        )
+
+    def cancelSegmentation(self):
+        if self._segmentationRequest is None:
+            return
+        self.segmentation.cancel()
+        self._segmentationRequest = None
+        self.update()
+
+    def _segmentationFinished(self, request, points):
+        if request != self._segmentationRequest:
+            return
+        self._segmentationRequest = None
+        if self.labeling() and not self.labeling_image:
+            self.api_points = self.imageSelectionWindow.simplify(
+                points
+            ).tolist()
+        self.update()
+
+    def _segmentationFailed(self, request, message):
+        if request != self._segmentationRequest:
+            return
+        self._segmentationRequest = None
+        logger.warning("Segmentation API request failed: {}".format(message))
+        self.update()
+
+    def queueBox(self):
+        """Keep the box being drawn as a pending box, see pendingBoxes."""
+        p1, p2 = self.line.points
+        self.pendingBoxes.append(
+            {"box": (p1.x(), p1.y(), p2.x(), p2.y()), "points": None}
+        )
+        self.current = None
+        self.setHiding(False)
+        self.drawingPolygon.emit(False)
+        self.update()
+
+    def _pendingBoxAt(self, pos):
+        """Index of the last pending box containing pos, None if none."""
+        for index in reversed(range(len(self.pendingBoxes))):
+            x1, y1, x2, y2 = self.pendingBoxes[index]["box"]
+            if (
+                min(x1, x2) <= pos.x() <= max(x1, x2)
+                and min(y1, y2) <= pos.y() <= max(y1, y2)
+            ):
+                return index
+        return None
+
+    def segmentPendingBoxes(self):
+        """Request the API polygons of the pending boxes in one request.
+
+        The polygons stream in as the server finishes them, see
+        _pendingBoxSegmented.
+        """
+        entries = [e for e in self.pendingBoxes if e["points"] is None]
+        if not entries:
+            return
+        self._pendingBoxesSent = entries
+        self._pendingBoxesRequest = self.boxSegmentation.submit_boxes(
+            self.imageMagicWand,
+            self.imageFilename,
+            [entry["box"] for entry in entries],
+        )
+        self.update()
+
+    def openPendingBox(self, index):
+        """Label a pending box, as if it had just been drawn.
+
+        Its API polygon is used if it arrived, and requested otherwise.
+        """
+        entry = self.pendingBoxes.pop(index)
+        x1, y1, x2, y2 = entry["box"]
+        self.cancelSegmentation()
+        self.current = Shape(shape_type="rectangle")
+        self.line.points = [QtCore.QPointF(x1, y1), QtCore.QPointF(x2, y2)]
+        self.line.close()
+        self.current.points = self.line.points
+        self.imageSelectionWindow._reset_slidewindow()
+        self.imageSelectionWindow._ix, self.imageSelectionWindow._iy = (
+            int(x1),
+            int(y1),
+        )
+        self.imageSelectionWindow._x, self.imageSelectionWindow._y = (
+            int(x2),
+            int(y2),
+        )
+        self.labeling_image = False
+        self.mode = self.LABEL
+        if entry["points"] is None:
+            self.segmentBox()
+        else:
+            self.api_points = entry["points"]
+        self.setHiding()
+        self.drawingPolygon.emit(True)
+        self.update()
+
+    def clearPendingBoxes(self):
+        self.boxSegmentation.cancel()
+        self.pendingBoxes = []
+        self._pendingBoxesRequest = None
+        self._pendingBoxesSent = []
+        self.update()
+
+    def _pendingBoxSegmented(self, request, index, points):
+        if request != self._pendingBoxesRequest:
+            return
+        if points is not None:
+            self._pendingBoxesSent[index][
+                "points"
+            ] = self.imageSelectionWindow.simplify(points).tolist()
+        self.update()
+
+    def _pendingBoxesFinished(self, request, points):
+        if request != self._pendingBoxesRequest:
+            return
+        self._pendingBoxesRequest = None
+        self.update()
+
+    def _pendingBoxesFailed(self, request, message):
+        if request != self._pendingBoxesRequest:
+            return
+        self._pendingBoxesRequest = None
+        logger.warning("Segmentation API request failed: {}".format(message))
+        self.update()
+
+    def flushMagicWand(self):
+        """Fill the queued Shift-click seeds as one batch."""
+        self._magicWandTimer.stop()
+        seeds, self._magicWandSeeds = self._magicWandSeeds, []
+        if not seeds or self.imageSelectionWindow is None:
+            return
+        list_of_points = self.imageSelectionWindow.fill_seeds(seeds)
+        if not self.labeling():
+            return
+        self.current = Shape(shape_type="polygon")
+        if self.api_points:
+            self.current.points = [
+                QtCore.QPointF(x, y)
+                for x, y in self._apiContour(list_of_points)
+            ]
+        else:
+            self.current.points = list_of_points
+
+        if len(self.current.points) >= 3:
+            self.current.addPoint(self.current.points[0])
+
+        if self.current.isClosed():
+            self.update()
+
+    def clearMagicWandSeeds(self):
+        """Drop the queued Shift-click seeds, which are for this image."""
+        self._magicWandTimer.stop()
+        self._magicWandSeeds = []
+
+    def setMagicWandTolerance(self, value):
+        if self.imageSelectionWindow is None:
+            return
+        self.flushMagicWand()
+        # the last magic wand click is redone with the new tolerance
+        self._setMagicWandPoints(
+            self.imageSelectionWindow.set_tolerance(value)
+        )
+
+    def undoMagicWand(self):
+        if self.imageSelectionWindow is None:
+            return
+        self.flushMagicWand()
+        self._setMagicWandPoints(self.imageSelectionWindow.undo())
+
+    def redoMagicWand(self):
+        if self.imageSelectionWindow is None:
+            return
+        self.flushMagicWand()
+        self._setMagicWandPoints(self.imageSelectionWindow.redo())
+
+    def _apiContour(self, list_of_points):
+        """API polygon with the magic wand points that lie outside it."""
+        if self.center is None:
+            self.center = np.mean(self.api_points, axis=0).tolist()
+        current_polygon = shapely.geometry.Polygon(self.api_points)
+        new_points = []
+        for point in list_of_points:
+            line = shapely.geometry.LineString(
+                [[self.center[0], self.center[1]], [point.x(), point.y()]]
+            )
+            if line.intersects(current_polygon):
+                new_points += [[point.x(), point.y()]]
+        return self.sort_contours(self.api_points + new_points, self.center)
+
+    def _setMagicWandPoints(self, points):
+        if points is None or not self.labeling():
+            return
+        self.current = Shape(shape_type="polygon")
+        if self.api_points:
+            # the wand selection is merged with the API polygon again
+            self.current.points = [
+                QtCore.QPointF(x, y) for x, y in self._apiContour(points)
+            ]
+        else:
+            self.current.points = points
+        if len(self.current.points) >= 3:
+            self.current.addPoint(self.current.points[0])
+        self.update()
+
     def mouseReleaseEvent(self, ev):
+        self.dragging = False
         if ev.button() == QtCore.Qt.RightButton:
             menu = self.menus[len(self.selectedShapesCopy) > 0]
             self.restoreCursor()
@@ -655,6 +1055,8 @@ class Canvas(QtWidgets.QWidget):
                     )
 
         if self.movingShape and self.hShape:
+            # the vertex edit is done, the holes it left outside go
+            self.hShape.dropOutsideHoles()
             index = self.shapes.index(self.hShape)
             if (
                 self.shapesBackups[-1][index].points
@@ -671,11 +1073,14 @@ class Canvas(QtWidgets.QWidget):
         if copy:
             for i, shape in enumerate(self.selectedShapesCopy):
                 self.shapes.append(shape)
+                self.shapeIndex.add(shape)
                 self.selectedShapes[i].selected = False
                 self.selectedShapes[i] = shape
         else:
             for i, shape in enumerate(self.selectedShapesCopy):
                 self.selectedShapes[i].points = shape.points
+                self.selectedShapes[i].holes = shape.holes
+                self.shapeIndex.update(self.selectedShapes[i])
         self.selectedShapesCopy = []
         self.repaint()
         self.storeShapes()
@@ -717,8 +1122,8 @@ class Canvas(QtWidgets.QWidget):
             index, shape = self.hVertex, self.hShape
             shape.highlightVertex(index, shape.MOVE_VERTEX)
         else:
-            for shape in reversed(self.shapes):
-                if self.isVisible(shape) and shape.containsPoint(point):
+            for shape in self._shapesAt(point):
+                if shape.containsPoint(point):
                     self.setHiding()
                     if shape not in self.selectedShapes:
                         if multiple_selection_mode:
@@ -762,6 +1167,7 @@ class Canvas(QtWidgets.QWidget):
         if self.outOfPixmap(pos):
             pos = self.intersectionPoint(point, pos)
         shape.moveVertexBy(index, pos - point)
+        self.shapeIndex.update(shape)
 
     def boundedMoveShapes(self, shapes, pos):
         if self.outOfPixmap(pos):
@@ -784,6 +1190,7 @@ class Canvas(QtWidgets.QWidget):
         if dp:
             for shape in shapes:
                 shape.moveBy(dp)
+                self.shapeIndex.update(shape)
             self.prevPoint = pos
             return True
         return False
@@ -800,6 +1207,7 @@ class Canvas(QtWidgets.QWidget):
         if self.selectedShapes:
             for shape in self.selectedShapes:
                 self.shapes.remove(shape)
+                self.shapeIndex.remove(shape)
                 deleted_shapes.append(shape)
             self.storeShapes()
             self.selectedShapes = []
@@ -811,6 +1219,7 @@ class Canvas(QtWidgets.QWidget):
             self.selectedShapes.remove(shape)
         if shape in self.shapes:
             self.shapes.remove(shape)
+            self.shapeIndex.remove(shape)
         self.storeShapes()
         self.update()
 
@@ -844,15 +1253,21 @@ class Canvas(QtWidgets.QWidget):
         p.scale(self.scale, self.scale)
         p.translate(self.offsetToCenter())
 
-        p.drawPixmap(0, 0, self.pixmap)
+        # the exposed parts of the image, with the pixels drawn around shapes
+        margin = self._shapeMargin()
+        exposed = [
+            self._imageRect(rect.adjusted(-margin, -margin, margin, margin))
+            for rect in event.region().rects()
+        ]
+
+        source = self._imageRect(event.rect()).toAlignedRect()
+        pad = int(2 / self.scale) + 1
+        source = source.adjusted(-pad, -pad, pad, pad) & self.pixmap.rect()
+        if not source.isEmpty():
+            p.drawPixmap(source.topLeft(), self.pixmap, source)
 
         # draw crosshair
-        if (
-            (self._createMode == "box" or self._crosshair[self._createMode])
-            and self.drawing()
-            and self.prevMovePoint
-            and not self.outOfPixmap(self.prevMovePoint)
-        ):
+        if self.drawsCrosshair():
             p.setPen(QtGui.QColor(0, 0, 0))
             p.drawLine(
                 0,
@@ -868,11 +1283,28 @@ class Canvas(QtWidgets.QWidget):
             )
 
         Shape.scale = self.scale
-        for shape in self.shapes:
-            if (shape.selected or not self._hideBackround) and self.isVisible(
-                shape
-            ):
-                shape.fill = shape.selected or shape == self.hShape
+        shapes = [
+            shape
+            for shape in self.shapes
+            if (shape.selected or not self._hideBackround)
+            and self.isVisible(shape)
+        ]
+        for shape in shapes:
+            shape.fill = shape.selected or shape == self.hShape
+        # while dragging, the shapes neither selected nor hovered, which do
+        # not change until the drag ends, are drawn from a layer
+        rect, layer = QtCore.QRect(), None
+        if self.dragging:
+            rect, layer = self.staticLayer([s for s in shapes if not s.fill])
+        if layer is not None and rect.contains(event.rect()):
+            p.save()
+            p.resetTransform()
+            p.drawPixmap(rect.topLeft(), layer)
+            p.restore()
+            shapes = [s for s in shapes if s.fill]
+        for shape in shapes:
+            rect = shape.boundingRect()
+            if any(_overlap(rect, other) for other in exposed):
                 shape.paint(p)
         if self.current:
             self.current.paint(p)
@@ -881,6 +1313,48 @@ class Canvas(QtWidgets.QWidget):
             for s in self.selectedShapesCopy:
                 s.paint(p)
 
+        if self._segmentationRequest is not None and self.labeling():
+            # the box is waiting for the segmentation API
+            pen = QtGui.QPen(QtGui.QColor(255, 255, 0))
+            pen.setStyle(QtCore.Qt.DashLine)
+            pen.setWidth(max(1, int(round(2.0 / self.scale))))
+            p.setPen(pen)
+            p.setBrush(QtCore.Qt.NoBrush)
+            p.drawRect(
+                QtCore.QRectF(
+                    QtCore.QPointF(
+                        self.imageSelectionWindow._ix,
+                        self.imageSelectionWindow._iy,
+                    ),
+                    QtCore.QPointF(
+                        self.imageSelectionWindow._x,
+                        self.imageSelectionWindow._y,
+                    ),
+                )
+            )
+
+        if self.pendingBoxes:
+            # dashed until their API polygon arrives
+            pen = QtGui.QPen(QtGui.QColor(255, 255, 0))
+            pen.setStyle(QtCore.Qt.DashLine)
+            pen.setWidth(max(1, int(round(2.0 / self.scale))))
+            p.setBrush(QtCore.Qt.NoBrush)
+            for entry in self.pendingBoxes:
+                x1, y1, x2, y2 = entry["box"]
+                p.setPen(pen)
+                p.drawRect(
+                    QtCore.QRectF(
+                        QtCore.QPointF(x1, y1), QtCore.QPointF(x2, y2)
+                    )
+                )
+                if entry["points"] is not None:
+                    p.setPen(QtGui.QPen(QtGui.QColor(0, 255, 0), pen.width()))
+                    p.drawPolygon(
+                        QtGui.QPolygonF(
+                            [QtCore.QPointF(x, y) for x, y in entry["points"]]
+                        )
+                    )
+
         if (
             self.fillDrawing()
             and self.createMode == "polygon"
@@ -913,14 +1387,46 @@ class Canvas(QtWidgets.QWidget):
 
     def finalise(self):
         assert self.current
+        parts = self._magicWandParts()
         self.current.close()
+        # the current shape stays the last one, see setLastLabel
+        self.shapes.extend(parts)
         self.shapes.append(self.current)
+        for shape in parts + [self.current]:
+            self.shapeIndex.add(shape)
+        self.lastShapesCount = 1 + len(parts)
         self.storeShapes()
         self.current = None
         self.setHiding(False)
         self.newShape.emit()
         self.update()
 
+    def _magicWandParts(self):
+        """Shapes for the regions of the selection other than the current.
+
+        Only in the components contour mode, where the current shape is the
+        largest region. The holes of each region go to Shape.holes.
+        """
+        if (
+            not self.labeling()
+            or self.api_points
+            or self.imageSelectionWindow is None
+            or self.imageSelectionWindow.contour_mode != "components"
+        ):
+            return []
+        components = self.imageSelectionWindow.components()
+        if not components:
+            return []
+        self.current.holes = components[0][1]
+        parts = []
+        for exterior, holes in components[1:]:
+            shape = Shape(shape_type="polygon")
+            shape.points = exterior
+            shape.close()
+            shape.holes = holes
+            parts.append(shape)
+        return parts
+
     def closeEnough(self, p1, p2):
         # d = distance(p1 - p2)
         # m = (p1-p2).manhattanLength()
@@ -1040,6 +1546,10 @@ class Canvas(QtWidgets.QWidget):
                 self.update()
             elif key == QtCore.Qt.Key_Return and self.canCloseShape():
                 self.finalise()
+            elif key == QtCore.Qt.Key_Return and self.createMode == "box":
+                self.segmentPendingBoxes()
+            elif key == QtCore.Qt.Key_Escape and self.pendingBoxes:
+                self.clearPendingBoxes()
             elif modifiers == QtCore.Qt.AltModifier:
                 self.snapping = False
         elif self.editing():
@@ -1071,6 +1581,9 @@ class Canvas(QtWidgets.QWidget):
 
     def setLastLabel(self, text, flags):
         assert text
+        for shape in self.shapes[-self.lastShapesCount : -1]:
+            shape.label = text
+            shape.flags = dict(flags)
         self.shapes[-1].label = text
         self.shapes[-1].flags = flags
         self.shapesBackups.pop()
@@ -1080,6 +1593,11 @@ class Canvas(QtWidgets.QWidget):
     def undoLastLine(self):
         assert self.shapes
         self.current = self.shapes.pop()
+        parts = self.shapes[len(self.shapes) - self.lastShapesCount + 1 :]
+        del self.shapes[len(self.shapes) - self.lastShapesCount + 1 :]
+        for shape in parts + [self.current]:
+            self.shapeIndex.remove(shape)
+        self.lastShapesCount = 1
         self.current.setOpen()
         if self.createMode in ["polygon", "linestrip"]:
             self.line.points = [self.current[-1], self.current[0]]
@@ -1090,6 +1608,9 @@ class Canvas(QtWidgets.QWidget):
         self.drawingPolygon.emit(True)
 
     def undoLastPoint(self):
+        if self.labeling():
+            self.undoMagicWand()
+            return
         if not self.current or self.current.isClosed():
             return
         self.current.popPoint()
@@ -1101,6 +1622,7 @@ class Canvas(QtWidgets.QWidget):
         self.update()
 
     def loadPixmap(self, pixmap, clear_shapes=True):
+        self.clearMagicWandSeeds()
         self.pixmap = pixmap
         if clear_shapes:
             self.shapes = []
@@ -1110,7 +1632,10 @@ class Canvas(QtWidgets.QWidget):
         if replace:
             self.shapes = list(shapes)
         else:
+            shapes = list(shapes)
             self.shapes.extend(shapes)
+            for shape in shapes:
+                self.shapeIndex.add(shape)
         self.storeShapes()
         self.current = None
         self.hShape = None
@@ -1131,6 +1656,9 @@ class Canvas(QtWidgets.QWidget):
         QtWidgets.QApplication.restoreOverrideCursor()
 
     def resetState(self):
+        self.cancelSegmentation()
+        self.clearPendingBoxes()
+        self.clearMagicWandSeeds()
         self.restoreCursor()
         self.pixmap = None
         self.shapesBackups = []
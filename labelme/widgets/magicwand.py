@@ -1,16 +1,23 @@
+import collections
 import math
 import cv2
 import numpy as np
 from qtpy import QtCore
 
+from labelme.utils.features import ImageFeatures
+from labelme.utils.shape import simplify_polygon
+from labelme.utils.tiles import TiledImage
+
 
 SHIFT_KEY = cv2.EVENT_FLAG_SHIFTKEY
 ALT_KEY = cv2.EVENT_FLAG_ALTKEY
 CTRL_KEY = cv2.EVENT_FLAG_CTRLKEY
 
 
-def _find_exterior_contours(img):
-    ret = cv2.findContours(img, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+def _find_exterior_contours(img, offset=(0, 0)):
+    ret = cv2.findContours(
+        img, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=offset
+    )
     """
     [, contours[, hierarchy[, offset]]]
     """
@@ -21,6 +28,55 @@ def _find_exterior_contours(img):
     raise Exception("Check the signature for `cv2.findContours()`.")
 
 
+def _hole_rings(img, hole, offset=(0, 0)):
+    """Outlines of the background pixels of img inside hole.
+
+    hole is an inner contour of img, which runs over the foreground pixels
+    around the hole. Cutting that ring out of a polygon would also cut out
+    those pixels, unlike these outlines, which run over the hole itself.
+    """
+    x, y, w, h = cv2.boundingRect(hole)
+    inside = np.zeros((h, w), dtype=np.uint8)
+    cv2.drawContours(inside, [hole], -1, 255, thickness=-1, offset=(-x, -y))
+    inside[img[y : y + h, x : x + w] > 0] = 0
+    return _find_exterior_contours(
+        inside, offset=(x + offset[0], y + offset[1])
+    )
+
+
+def _find_components(img, offset=(0, 0)):
+    """Outer boundary and holes of each region of img, largest region first.
+
+    Returns a list of (exterior, holes) pairs of contours. The two level
+    hierarchy of RETR_CCOMP puts regions inside holes at the top level, so
+    each pair is one connected region. The holes are traced on the
+    background side, see _hole_rings.
+    """
+    ret = cv2.findContours(img, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    contours, hierarchy = ret[-2], ret[-1]
+    if hierarchy is None:
+        return []
+    parents = hierarchy.reshape(-1, 4)[:, 3]
+    outer = np.flatnonzero(parents < 0)
+    inner = np.flatnonzero(parents >= 0)
+    inner = inner[np.argsort(parents[inner], kind="stable")]
+    # the holes of each region are a run of inner, sorted by parent
+    starts = np.searchsorted(parents[inner], outer, side="left")
+    ends = np.searchsorted(parents[inner], outer, side="right")
+    areas = np.array([cv2.contourArea(contours[i]) for i in outer])
+    return [
+        (
+            contours[outer[k]] + np.asarray(offset, dtype=np.int32),
+            [
+                ring
+                for i in inner[starts[k] : ends[k]]
+                for ring in _hole_rings(img, contours[i], offset)
+            ],
+        )
+        for k in np.argsort(-areas, kind="stable")
+    ]
+
+
 def check_intersection(start_point, end_point, check_point):
     # a[0] = x, a[1] = y
     if (check_point[0] >= start_point[0] and check_point[1] >= start_point[1]) and \
@@ -29,14 +85,479 @@ def check_intersection(start_point, end_point, check_point):
     return False
 
 
+def _contour_points(contours):
+    """Stack the vertices of all contours into one float32 (N, 2) array."""
+    if not contours:
+        return np.zeros((0, 2), dtype=np.float32)
+    return np.concatenate(contours).reshape(-1, 2).astype(np.float32)
+
+
+def _angles_between(vectors_1, vectors_2):
+    """Angles in degrees between rows of two (N, 2) arrays of vectors."""
+    vectors_1 = np.asarray(vectors_1, dtype=np.float64)
+    vectors_2 = np.asarray(vectors_2, dtype=np.float64)
+    norm_1 = np.sqrt((vectors_1 * vectors_1).sum(axis=-1, keepdims=True))
+    norm_2 = np.sqrt((vectors_2 * vectors_2).sum(axis=-1, keepdims=True))
+    unit_1 = vectors_1 / (norm_1 + 0.001)
+    unit_2 = vectors_2 / (norm_2 + 0.001)
+    dot_product = (unit_1 * unit_2).sum(axis=-1)
+    angles = np.arccos(np.clip(dot_product, -1.0, 1.0))
+    return angles * 180 / math.pi
+
+
+def _angle_between(vector_1, vector_2):
+    """Scalar version of _angles_between for a single pair of vectors."""
+    norm_1 = math.sqrt(vector_1[0] ** 2 + vector_1[1] ** 2) + 0.001
+    norm_2 = math.sqrt(vector_2[0] ** 2 + vector_2[1] ** 2) + 0.001
+    dot_product = (vector_1[0] / norm_1) * (vector_2[0] / norm_2) + (
+        vector_1[1] / norm_1
+    ) * (vector_2[1] / norm_2)
+    return math.acos(min(max(dot_product, -1.0), 1.0)) * 180 / math.pi
+
+
+def _clockwise_order(points, center):
+    """Indices sorting points by angle around center, then by distance."""
+    vectors = points - center
+    lengths = np.hypot(vectors[:, 0], vectors[:, 1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        angles = np.arctan2(vectors[:, 0] / lengths, vectors[:, 1] / lengths)
+    angles[angles < 0] += 2 * math.pi
+    # points on the center come first
+    angles[lengths == 0] = -math.pi
+    return np.lexsort((lengths, angles))
+
+
+def _facing_points(points, center, pos):
+    """The points seen from pos within 45 degrees of the direction of center.
+
+    This keeps the side of the selection away from an Alt+click at pos.
+    """
+    pos = np.asarray(pos, dtype=np.float64)
+    angles = _angles_between(center - pos, points - pos)
+    return points[angles <= 45]
+
+
+def _bridge_rings(rings):
+    """Rings joined into one polygon, each kept in contour order.
+
+    Every other ring hangs off the first one by a bridge between their
+    closest vertices, walked there and back, so that the polygon only
+    crosses itself where a bridge crosses a ring.
+    """
+    rings = [np.asarray(ring).reshape(-1, 2) for ring in rings if len(ring)]
+    if not rings:
+        return np.empty((0, 2))
+    first = rings[0]
+    # vertex of the first ring: rings hanging off it, rotated to the bridge
+    bridges = collections.defaultdict(list)
+    for ring in rings[1:]:
+        distances = np.linalg.norm(
+            first[:, None].astype(np.float64) - ring[None], axis=2
+        )
+        i, j = np.unravel_index(np.argmin(distances), distances.shape)
+        bridges[i].append(np.roll(ring, -j, axis=0))
+    points = []
+    for i, point in enumerate(first):
+        points.append(point)
+        for ring in bridges[i]:
+            points.extend(ring)
+            points.extend([ring[0], point])
+    return np.asarray(points)
+
+
+def _thin_contour_points(
+    points, pos=None, threshold_angle=20, threshold_distance=50
+):
+    """Reduce contour vertices to a clockwise polygon outline.
+
+    Keeps the points farther than average from the centroid, optionally only
+    those facing away from pos (the Alt+click position), sorts them
+    clockwise and greedily drops points that are too close to, or too
+    aligned with, the previously kept ones.
+    """
+    if len(points) == 0:
+        return points
+    center = points.mean(axis=0, dtype=np.float64)
+    vectors = points - center
+    distances = np.hypot(vectors[:, 0], vectors[:, 1])
+    points = points[distances >= distances.mean()]
+
+    if pos is not None:
+        points = _facing_points(points, center, pos)
+    if len(points) == 0:
+        return points
+
+    points = points[_clockwise_order(points, center)]
+
+    steps = np.diff(points, axis=0).astype(np.float64)
+    # a point is considered only after a point off the origin
+    after_valid = np.zeros(len(points), dtype=bool)
+    after_valid[1:] = (points[:-1] != 0).any(axis=1)
+    far = np.zeros(len(points), dtype=bool)
+    far[1:] = np.hypot(steps[:, 0], steps[:, 1]) > threshold_distance
+
+    candidates = np.flatnonzero(after_valid)
+    kept = candidates[:2].tolist()
+    # the angle test depends on the last kept points, so it stays a loop,
+    # but only over the few points that pass the distance test
+    xy = points.tolist()
+    for i in candidates[2:][far[candidates[2:]]].tolist():
+        (x, y), (x1, y1), (x2, y2) = xy[i], xy[kept[-1]], xy[kept[-2]]
+        angle = _angle_between((x - x1, y - y1), (x2 - x1, y2 - y1))
+        if angle > threshold_angle:
+            kept.append(i)
+    return points[kept]
+
+
+class FloodFillEngine(object):
+    """Mask-only flood fill confined to the inside of a box.
+
+    The box outline acts as a barrier, so the fill only ever reads a view of
+    the box interior and writes into a mask buffer that is one pixel larger
+    on each side. The buffer is reused between fills of the same box.
+    """
+
+    def __init__(self, img, connectivity=4):
+        self.img = img
+        self.connectivity = connectivity
+        self._flags = (
+            connectivity
+            | cv2.FLOODFILL_FIXED_RANGE
+            | cv2.FLOODFILL_MASK_ONLY
+            | 255 << 8
+        )  # 255 << 8 tells to fill with the value 255
+        self._box = (0, 0, 0, 0)
+        self.origin = (0, 0)
+        self._view = img[0:0, 0:0]
+        self._buffer = np.zeros((2, 2), dtype=np.uint8)
+
+    @property
+    def shape(self):
+        """Shape of the box masks, outline included."""
+        return self._buffer.shape
+
+    def set_box(self, x1, y1, x2, y2):
+        h, w = self.img.shape[:2]
+        left, right = sorted((x1, x2))
+        top, bottom = sorted((y1, y2))
+        # the outline itself is never filled, only what lies strictly inside
+        c0, c1 = max(left + 1, 0), min(right, w)
+        r0, r1 = max(top + 1, 0), min(bottom, h)
+        c1, r1 = max(c0, c1), max(r0, r1)
+        self._box = (x1, y1, x2, y2)
+        self.origin = (c0 - 1, r0 - 1)
+        self._view = self.img[r0:r1, c0:c1]
+        shape = (r1 - r0 + 2, c1 - c0 + 2)
+        if self._buffer.shape != shape:
+            self._buffer = np.zeros(shape, dtype=np.uint8)
+
+    def _seed(self, x, y):
+        """Image point (x, y) in view coordinates, None if not inside."""
+        vx, vy = x - self.origin[0] - 1, y - self.origin[1] - 1
+        vh, vw = self._view.shape[:2]
+        if 0 <= vx < vw and 0 <= vy < vh:
+            return vx, vy
+        return None
+
+    def fill(self, x, y, tolerance):
+        """Fill from image point (x, y) and return the box mask.
+
+        The returned array is the engine's buffer and is overwritten by the
+        next call; seeds outside the box interior give an empty mask.
+        """
+        self._buffer[:] = 0
+        seed = self._seed(x, y)
+        if seed is not None:
+            cv2.floodFill(
+                self._view,
+                self._buffer,
+                seed,
+                0,
+                tolerance,
+                tolerance,
+                self._flags,
+            )
+            # floodFill marks the mask border as visited, it is not selected
+            self._buffer[[0, -1], :] = 0
+            self._buffer[:, [0, -1]] = 0
+        return self._buffer
+
+    def join_levels(self, x, y):
+        """Lowest tolerance at which each box pixel joins the fill from (x, y).
+
+        This is a priority flood with a bucket queue indexed by tolerance:
+        pixels reached from the region at level t whose largest channel
+        difference to the seed is at most t join at t, the others wait in
+        the bucket of their own difference. Each level is grown one
+        wavefront at a time, so every pixel is visited once. The outline is
+        255 and never selected by threshold(). Returns None for seeds
+        outside the box interior.
+        """
+        seed = self._seed(x, y)
+        if seed is None:
+            return None
+        view = self._view
+        cost = np.abs(
+            view.astype(np.int16) - view[seed[1], seed[0]].astype(np.int16)
+        )
+        if cost.ndim == 3:
+            cost = cost.max(axis=2)
+
+        # flat indices into the box mask, whose outline stops the flood
+        h, w = self.shape
+        cost = np.pad(cost.astype(np.uint8), 1).ravel()
+        visited = np.ones((h, w), dtype=bool)
+        visited[1:-1, 1:-1] = False
+        visited = visited.ravel()
+        levels = np.full(h * w, 255, dtype=np.uint8)
+        owner = np.zeros(h * w, dtype=np.intp)
+        steps = np.array([-w, -1, 1, w])
+        if self.connectivity == 8:
+            steps = np.concatenate([steps, [-w - 1, -w + 1, w - 1, w + 1]])
+
+        start = (seed[1] + 1) * w + seed[0] + 1
+        visited[start] = True
+        front = np.array([start])
+        # pixels reached below their cost, put in the bucket of their cost
+        # once the level is done
+        waiting = []
+        buckets = {}
+        for level in range(256):
+            if waiting:
+                waiting = np.concatenate(waiting)
+                waiting = waiting[np.argsort(cost[waiting], kind="stable")]
+                splits = np.flatnonzero(np.diff(cost[waiting])) + 1
+                for part in np.split(waiting, splits):
+                    if part.size:
+                        buckets.setdefault(int(cost[part[0]]), []).append(part)
+                waiting = []
+            if level in buckets:
+                front = np.concatenate([front] + buckets.pop(level))
+            while front.size:
+                levels[front] = level
+                around = (front[:, None] + steps).ravel()
+                around = around[~visited[around]]
+                # a pixel next to several of the front is taken once
+                order = np.arange(around.size)
+                owner[around] = order
+                around = around[owner[around] == order]
+                visited[around] = True
+                joins = cost[around] <= level
+                waiting.append(around[~joins])
+                front = around[joins]
+            if not buckets and not any(part.size for part in waiting):
+                break
+        return levels.reshape(h, w)
+
+    def _color_range(self, seed, tolerance):
+        """Lower and upper color bounds of a fill from seed (view coords)."""
+        color = np.atleast_1d(self._view[seed[1], seed[0]]).astype(int)
+        lower = np.clip(color - tolerance[: color.size], 0, 255)
+        upper = np.clip(color + tolerance[: color.size], 0, 255)
+        return tuple(lower.tolist()), tuple(upper.tolist())
+
+    def fill_coarse_to_fine(self, x, y, tolerance, coarse, scale):
+        """Fill from (x, y) on a downsampled image, refining the boundary.
+
+        coarse is an engine on the image downsampled by scale. The pixels
+        within tolerance of the full resolution seed color are filled on it,
+        the result is upsampled, and only a band of two coarse pixels around
+        its boundary is tested again at full resolution before reconnecting
+        to the seed. Everything at full resolution is restricted to the
+        bounding box of the coarse fill. Falls back to fill() when the
+        region is too small to show up on the coarse image. Like fill(),
+        this returns the reused engine buffer.
+        """
+        seed = self._seed(x, y)
+        if seed is None:
+            return self.fill(x, y, tolerance)
+        lower, upper = self._color_range(seed, tolerance)
+        flags = (self._flags & 0xFF) | cv2.FLOODFILL_MASK_ONLY | 255 << 8
+
+        coarse.set_box(*[v // scale for v in self._box])
+        coarse_seed = coarse._seed(x // scale, y // scale)
+        coarse_mask = coarse._buffer
+        coarse_mask[:] = 0
+        if coarse_seed is None:
+            return self.fill(x, y, tolerance)
+        within = cv2.inRange(coarse._view, lower, upper)
+        if not within[coarse_seed[1], coarse_seed[0]]:
+            return self.fill(x, y, tolerance)
+        area, _, _, (rx, ry, rw, rh) = cv2.floodFill(
+            within, coarse_mask, coarse_seed, 0, 0, 0, flags
+        )
+        coarse_mask[[0, -1], :] = 0
+        coarse_mask[:, [0, -1]] = 0
+        if area < 4:
+            return self.fill(x, y, tolerance)
+
+        # pyrDown blurs edges over about two pixels of each level
+        band = 2
+        # bounding box of the coarse fill plus the band, in view coordinates
+        # at full resolution
+        vh, vw = self._view.shape[:2]
+        vx0, vy0 = self.origin[0] + 1, self.origin[1] + 1
+        cx0, cy0 = coarse.origin[0] + 1, coarse.origin[1] + 1
+        x0 = max((rx - band + cx0) * scale - vx0, 0)
+        y0 = max((ry - band + cy0) * scale - vy0, 0)
+        x1 = min((rx + rw + band + cx0) * scale - vx0, vw)
+        y1 = min((ry + rh + band + cy0) * scale - vy0, vh)
+
+        # upsampled coarse fill over that box; coarse mask indices are view
+        # indices + 1, so its border covers the outline
+        cc0, cc1 = (x0 + vx0) // scale - cx0, (x1 - 1 + vx0) // scale - cx0
+        cr0, cr1 = (y0 + vy0) // scale - cy0, (y1 - 1 + vy0) // scale - cy0
+        up = cv2.resize(
+            coarse_mask[cr0 + 1 : cr1 + 2, cc0 + 1 : cc1 + 2],
+            None,
+            fx=scale,
+            fy=scale,
+            interpolation=cv2.INTER_NEAREST,
+        )
+        ux, uy = x0 + vx0 - (cc0 + cx0) * scale, y0 + vy0 - (cr0 + cy0) * scale
+        up = up[uy : uy + y1 - y0, ux : ux + x1 - x0]
+
+        size = 2 * band * scale + 1
+        kernel = np.ones((size, size), dtype=np.uint8)
+        core = cv2.erode(up, kernel)
+        candidates = cv2.bitwise_and(
+            cv2.subtract(cv2.dilate(up, kernel), core),
+            cv2.inRange(self._view[y0:y1, x0:x1], lower, upper),
+        )
+        selected = cv2.bitwise_or(core, candidates)
+        selected[seed[1] - y0, seed[0] - x0] = 255
+
+        # keep what is still connected to the seed
+        self._buffer[:] = 0
+        region = self._buffer[y0 : y1 + 2, x0 : x1 + 2]
+        cv2.floodFill(
+            selected, region, (seed[0] - x0, seed[1] - y0), 0, 0, 0, flags
+        )
+        region[[0, -1], :] = 0
+        region[:, [0, -1]] = 0
+        return self._buffer
+
+    def threshold(self, levels, tolerance):
+        """Box mask of the fill at tolerance from a join_levels() map.
+
+        Like fill(), this returns the reused engine buffer.
+        """
+        self._buffer[:] = 0
+        if levels is not None:
+            interior = self._buffer[1:-1, 1:-1]
+            interior[levels[1:-1, 1:-1] <= tolerance] = 255
+        return self._buffer
+
+
+class SelectionHistory(object):
+    """Undo/redo log of the changes made to a selection mask.
+
+    Each entry is the XOR delta of one click, cropped to the bounding box of
+    the pixels it changed and bit-packed, so a click costs about one bit per
+    changed pixel. The oldest entries are dropped once the log grows past
+    budget bytes, but the latest one is always kept.
+    """
+
+    def __init__(self, budget=16 * 1024 * 1024):
+        self.budget = budget
+        self._undo = []
+        self._redo = []
+        self._size = 0
+
+    def __len__(self):
+        return len(self._undo)
+
+    @property
+    def last(self):
+        """The click recorded with the latest undoable entry, or None."""
+        if not self._undo:
+            return None
+        return self._undo[-1][2]
+
+    def clear(self):
+        self._undo = []
+        self._redo = []
+        self._size = 0
+
+    def record(self, delta, click=None):
+        """Record delta, the pixels flipped by one click, clearing redo."""
+        x, y, w, h = cv2.boundingRect(delta)
+        bits = np.packbits(delta[y : y + h, x : x + w] > 0)
+        self._undo.append(((x, y, w, h), bits, click))
+        self._size += bits.nbytes
+        for entry in self._redo:
+            self._size -= entry[1].nbytes
+        self._redo = []
+        while self._size > self.budget and len(self._undo) > 1:
+            self._size -= self._undo.pop(0)[1].nbytes
+
+    @staticmethod
+    def _flip(mask, entry):
+        (x, y, w, h), bits = entry[:2]
+        delta = np.unpackbits(bits, count=w * h).reshape(h, w) * 255
+        region = mask[y : y + h, x : x + w]
+        np.bitwise_xor(region, delta, out=region)
+
+    def undo(self, mask):
+        """Revert the latest entry in mask. Returns False if there is none."""
+        if not self._undo:
+            return False
+        entry = self._undo.pop()
+        self._flip(mask, entry)
+        self._redo.append(entry)
+        return True
+
+    def redo(self, mask):
+        """Reapply the latest undone entry. Returns False if there is none."""
+        if not self._redo:
+            return False
+        entry = self._redo.pop()
+        self._flip(mask, entry)
+        self._undo.append(entry)
+        return True
+
+
 class SelectionWindow:
-    def __init__(self, img, connectivity=4, tolerance=32):
+
+    # floodfill: one cv2.floodFill per click
+    # barrier: join level map per seed, cheap to re-threshold on tolerance
+    #          changes, see FloodFillEngine.join_levels
+    # pyramid: fill on a downsampled image and refine the boundary, see
+    #          FloodFillEngine.fill_coarse_to_fine
+    METHODS = ["floodfill", "barrier", "pyramid"]
+
+    # outline: a single polygon for the whole selection
+    # components: one polygon per connected region, with its holes, see
+    #             components
+    CONTOUR_MODES = ["outline", "components"]
+
+    def __init__(
+        self,
+        img,
+        connectivity=4,
+        tolerance=32,
+        method=None,
+        pyramid_depth=2,
+        features=None,
+        history_budget=16 * 1024 * 1024,
+        simplify_tolerance=None,
+        max_vertices=None,
+        contour_mode=None,
+    ):
         h, w = img.shape[:2]
         self.img = img
-        self.img_copy = img.copy()
-        self.rectangle = img
-        self.mask = np.zeros((h, w), dtype=np.uint8)
-        self._flood_mask = np.zeros((h + 2, w + 2), dtype=np.uint8)
+        # shared with the app, which may build the pyramid in the background
+        self.features = ImageFeatures(img) if features is None else features
+        self._engine = FloodFillEngine(img, connectivity=connectivity)
+        self._coarse_engine = None
+        self.pyramid_depth = pyramid_depth
+        # selection mask cropped to the box, see FloodFillEngine.shape
+        self._mask = None
+        self._box = None
+        # clicks made in the current box, for undo and tolerance changes
+        self.history = SelectionHistory(budget=history_budget)
+        # (x, y, join level map) of the last seed in barrier mode
+        self._levels = None
         self._x = w
         self._y = h
         self._ix = 0
@@ -44,169 +565,238 @@ class SelectionWindow:
 
         self.threshold_distance = 50
         self.threshold_angle = 20
-        
-        self._flood_fill_flags = (
-            connectivity | cv2.FLOODFILL_FIXED_RANGE | cv2.FLOODFILL_MASK_ONLY | 255 << 8
-        )  # 255 << 8 tells to fill with the value 255
+        # see simplify, with both None _contours thins the contour points
+        # with threshold_distance and threshold_angle instead
+        self.simplify_tolerance = simplify_tolerance
+        self.max_vertices = max_vertices
+
         self.tolerance = (tolerance,) * 3
+        self.method = method
+        self.contour_mode = contour_mode
+
+    @property
+    def method(self):
+        return self._method
+
+    @method.setter
+    def method(self, value):
+        if value is None:
+            value = "floodfill"
+        if value not in self.METHODS:
+            raise ValueError("Unexpected magic wand method: {}".format(value))
+        self._method = value
+        self._levels = None
+
+    @property
+    def contour_mode(self):
+        return self._contour_mode
+
+    @contour_mode.setter
+    def contour_mode(self, value):
+        if value is None:
+            value = "outline"
+        if value not in self.CONTOUR_MODES:
+            raise ValueError("Unexpected contour mode: {}".format(value))
+        self._contour_mode = value
+
+    @property
+    def mask(self):
+        """Full-size selection mask, built on demand from the box crop.
+
+        This allocates an image-sized array on each access; the wand itself
+        only keeps the box crop, so use it for checks, not in the GUI.
+        """
+        h, w = self.img.shape[:2]
+        mask = np.zeros((h, w), dtype=np.uint8)
+        if self._mask is not None:
+            ox, oy = self._engine.origin
+            mh, mw = self._mask.shape
+            x0, y0 = max(ox, 0), max(oy, 0)
+            x1, y1 = min(ox + mw, w), min(oy + mh, h)
+            mask[y0:y1, x0:x1] = self._mask[
+                y0 - oy : y1 - oy, x0 - ox : x1 - ox
+            ]
+        return mask
 
-    
     def _reset_slidewindow(self):
-        self.rectangle = self.img.copy()
         self._y, self._x = self.img.shape[:2]
         self._ix = 0
         self._iy = 0
-        self.mask = np.zeros((self._y, self._x), dtype=np.uint8)
-        self._flood_mask = np.zeros((self._y + 2, self._x + 2), dtype=np.uint8)
-    
+        self._mask = None
+        self._box = None
+        self.history.clear()
+        self._levels = None
+
+    def _selection(self):
+        box = (self._ix, self._iy, self._x, self._y)
+        if box != self._box:
+            self._engine.set_box(*box)
+            self._mask = np.zeros(self._engine.shape, dtype=np.uint8)
+            self._box = box
+            self.history.clear()
+            self._levels = None
+        return self._mask
+
+    def _apply(self, seeds):
+        mask = self._selection()
+        # the pixels flipped by the seeds, applied in place and logged as a
+        # single entry for undo
+        delta = np.zeros_like(mask)
+        for x, y, add in seeds:
+            floodmask = self._floodfill(x, y)
+            if add:
+                flipped = cv2.subtract(floodmask, mask)
+            else:
+                flipped = cv2.bitwise_and(floodmask, mask)
+            cv2.bitwise_xor(mask, flipped, dst=mask)
+            cv2.bitwise_xor(delta, flipped, dst=delta)
+        self.history.record(delta, click=seeds)
+
+    def fill_seeds(self, seeds):
+        """Add or subtract the fill from each (x, y, add) seed, in order.
+
+        This is the same as a Shift (add) or Alt click on each seed, but the
+        contours are only extracted once at the end, and the seeds are undone
+        together. Returns the contour points as the click on the last seed
+        would, or None if there are no seeds.
+        """
+        seeds = tuple((int(x), int(y), bool(add)) for x, y, add in seeds)
+        if not seeds:
+            return None
+        self._apply(seeds)
+        return self._click_contours(seeds)
 
     def _shift_key(self, x, y):
-        self.rectangle = cv2.rectangle(self.img_copy.copy(), (self._ix, self._iy), (self._x, self._y), (255, 38, 0), 1)
-        floodmask = self._floodfill(x, y)
-        self.mask = cv2.bitwise_or(self.mask, floodmask)
-        
-        return self._contours()
-    
+        return self.fill_seeds([(x, y, True)])
 
     def _alt_key(self, x, y):
-        self.rectangle = cv2.rectangle(self.img_copy.copy(), (self._ix, self._iy), (self._x, self._y), (255, 38, 0), 1)
-        floodmask = self._floodfill(x, y)
-        self.mask = cv2.bitwise_and(self.mask, cv2.bitwise_not(floodmask))
-
-        pos = QtCore.QPointF(x, y)
-
-        return self._contours(pos)
-
+        return self.fill_seeds([(x, y, False)])
 
     def _floodfill(self, x, y):
-        floodmask = None
-        self._flood_mask[:] = 0
-        cv2.floodFill(
-            self.rectangle,
-            self._flood_mask,
-            (x, y),
-            0,
-            self.tolerance,
-            self.tolerance,
-            self._flood_fill_flags,
-        )
-        floodmask = self._flood_mask[1:-1, 1:-1].copy()
-        return floodmask
-
-    
-    def distance_between_points(self, point_1, point_2):
-        vector = [point_2.x()-point_1.x(), point_2.y()-point_1.y()]
-        return math.hypot(vector[0], vector[1])
-
-
-    def angle_between_points(self, point_1, point_2):
-        vector_1 = [point_1.x(), point_1.y()]
-        vector_2 = [point_2.x(), point_2.y()]
-
-        unit_vector_1 = vector_1 / (np.linalg.norm(vector_1) + 0.001)
-        unit_vector_2 = vector_2 / (np.linalg.norm(vector_2) + 0.001)
-        dot_product = np.dot(unit_vector_1, unit_vector_2)
-        angle = np.arccos(np.clip(dot_product, -1.0, 1.0))
-
-        return angle * 180 / math.pi
-    
-
-    def sort_contours(self, contours, center):
-        refvec = [0, 1]
-        
-        def clockwise_sort(point):
-            vector = [point.x() - center.x(), point.y() - center.y()]
-            len_vector = self.distance_between_points(center, point)
-            
-            if len_vector == 0:
-                return -math.pi, 0
-
-            # Normalize vector: v/||v||
-            normalized = [vector[0]/len_vector, vector[1]/len_vector]
-
-            dotprod  = normalized[0] * refvec[0] + normalized[1] * refvec[1] # x1*x2 + y1*y2
-            diffprod = refvec[1] * normalized[0] - refvec[0] * normalized[1] # x1*y2 - y1*x2
-            angle = math.atan2(diffprod, dotprod) # angle = arctan2(y, x)
-
-            if angle < 0:
-                return 2*math.pi + angle, len_vector
-
-            # first is the angle, but if two vectors have the same angle then 
-            # the shorter distance should come first.
-            return angle, len_vector
-
-        return sorted(contours, key=clockwise_sort)
-
+        self._selection()
+        if self.method == "barrier":
+            if self._levels is None or self._levels[:2] != (x, y):
+                self._levels = (x, y, self._engine.join_levels(x, y))
+            # the join levels assume the same tolerance on every channel
+            return self._engine.threshold(self._levels[2], min(self.tolerance))
+        # the pyramid of a tiled image would have to be held in memory whole
+        if (
+            self.method == "pyramid"
+            and self.pyramid_depth > 0
+            and not isinstance(self.img, TiledImage)
+        ):
+            return self._engine.fill_coarse_to_fine(
+                x,
+                y,
+                self.tolerance,
+                coarse=self._coarse(),
+                scale=2**self.pyramid_depth,
+            )
+        return self._engine.fill(x, y, self.tolerance)
+
+    def _coarse(self):
+        """Engine on the pyramid level for pyramid_depth, made on demand."""
+        img = self.features.pyramid[self.pyramid_depth]
+        if self._coarse_engine is None or self._coarse_engine.img is not img:
+            self._coarse_engine = FloodFillEngine(
+                img, connectivity=self._engine.connectivity
+            )
+        return self._coarse_engine
+
+    def set_tolerance(self, tolerance):
+        """Set the tolerance and redo the last click (or seeds) with it.
+
+        Returns the contour points of the updated selection, or None if there
+        is no click to redo.
+        """
+        self.tolerance = (tolerance,) * 3
+        seeds = self.history.last
+        if seeds is None:
+            return None
+        self.history.undo(self._mask)
+        return self.fill_seeds(seeds)
+
+    def undo(self):
+        """Undo the last Shift/Alt click in the box.
+
+        Returns the contour points of the selection before that click, or
+        None if there is nothing to undo.
+        """
+        if self._mask is None or not self.history.undo(self._mask):
+            return None
+        return self._click_contours(self.history.last)
+
+    def redo(self):
+        """Redo the last undone click, see undo."""
+        if self._mask is None or not self.history.redo(self._mask):
+            return None
+        return self._click_contours(self.history.last)
+
+    def _click_contours(self, seeds):
+        # contours as returned by _shift_key or _alt_key on the last seed
+        if not seeds or seeds[-1][2]:
+            return self._contours()
+        x, y, _ = seeds[-1]
+        return self._contours(QtCore.QPointF(x, y))
 
     def _contours(self, pos=None):
-        ret = _find_exterior_contours(self.mask)
-
-        contours = []
-        temp_x, temp_y = 0, 0
-
-        for x in ret:
-            for xx in x:
-                for xxx in xx:
-                    contours += [QtCore.QPointF(xxx[0], xxx[1])]
-                    temp_x += xxx[0]
-                    temp_y += xxx[1]
-        
-        if len(contours) > 0:
-        
-            # calculate coordinates of "center" point
-            temp_x, temp_y = temp_x/len(contours), temp_y/len(contours)
-            center = QtCore.QPointF(temp_x, temp_y)
-
-            # calculate the average distance of all points from "center" point
-            d = 0
-            for point in contours:
-                vector = [point.x() - center.x(), point.y() - center.y()]
-                d += math.hypot(vector[0], vector[1])
-            d = d/len(contours)
-
-            # just keep the point having distance > d from center
-            temp_contours = []
-            for point in contours:
-                vector = [point.x() - center.x(), point.y() - center.y()]
-                if math.hypot(vector[0], vector[1]) >= d:
-                    temp_contours += [point]
-            contours = temp_contours
-
-            """
-            In case: Alt + Left button
-            Description: Delete points
-            """
-            if pos:
-                temp_contours = []
-                diff_1 = QtCore.QPointF(center.x()-pos.x(), center.y()-pos.y())
-                for point in contours:
-                    diff_2 = QtCore.QPointF(point.x()-pos.x(), point.y()-pos.y())
-                    if self.angle_between_points(diff_1, diff_2) <= 45:
-                        temp_contours += [point]
-                contours = temp_contours
-            """
-            End case.
-            """
-
-            contours = self.sort_contours(contours, center)
-
-            current_contours = []
-            temp = None
-            
-            for i, point in enumerate(contours):
-                if temp:
-                    if i >= 3 and len(current_contours) >= 2:
-                        diff_1 = QtCore.QPointF(point.x()-current_contours[-1].x(), point.y()-current_contours[-1].y())
-                        diff_2 = QtCore.QPointF(current_contours[-2].x()-current_contours[-1].x(), \
-                            current_contours[-2].y()-current_contours[-1].y())
-                        if self.angle_between_points(diff_1, diff_2) > self.threshold_angle and \
-                            self.distance_between_points(temp, point) > self.threshold_distance:
-                            current_contours += [point]
-                    elif len(current_contours) < 2:
-                        current_contours += [point]
-                temp = point
-            
-            return current_contours
-        
+        if self._mask is None:
+            return []
+        ret = _find_exterior_contours(self._mask, offset=self._engine.origin)
+        pos = (pos.x(), pos.y()) if pos else None
+        if self.contour_mode == "components":
+            # the outline of the largest region, in contour order, the other
+            # regions are shapes of their own, see components
+            if ret:
+                ret = [max(ret, key=cv2.contourArea)]
+            points = self.simplify(_contour_points(ret))
+        elif self.simplify_tolerance is None and self.max_vertices is None:
+            points = _thin_contour_points(
+                _contour_points(ret),
+                pos=pos,
+                threshold_angle=self.threshold_angle,
+                threshold_distance=self.threshold_distance,
+            )
         else:
-            return contours
+            # every region simplified and kept in contour order, the largest
+            # first: the mask already went without the Alt+clicked parts
+            ret = sorted(ret, key=cv2.contourArea, reverse=True)
+            points = _bridge_rings(
+                [self.simplify(_contour_points([c])) for c in ret]
+            )
+        return [QtCore.QPointF(x, y) for x, y in points.tolist()]
+
+    def components(self):
+        """One polygon per connected region of the selection.
+
+        Returns (exterior, holes) pairs, the largest region first, with the
+        exterior and each hole as a simplified (N, 2) array. Rings with less
+        than 3 vertices, left by single pixel regions or holes, are dropped.
+        """
+        if self._mask is None:
+            return []
+        polygons = []
+        for exterior, holes in _find_components(
+            self._mask, offset=self._engine.origin
+        ):
+            exterior = self.simplify(_contour_points([exterior]))
+            if len(exterior) < 3:
+                continue
+            holes = [self.simplify(_contour_points([hole])) for hole in holes]
+            holes = [hole for hole in holes if len(hole) >= 3]
+            polygons.append((exterior, holes))
+        return polygons
+
+    def simplify(self, points):
+        """Simplify a polygon from the wand or the segmentation API.
+
+        See labelme.utils.simplify_polygon, with simplify_tolerance and
+        max_vertices. Returns the points as a (N, 2) array.
+        """
+        if self.simplify_tolerance is None and self.max_vertices is None:
+            return np.asarray(points).reshape(-1, 2)
+        return simplify_polygon(
+            points,
+            tolerance=self.simplify_tolerance or 0,
+            max_vertices=self.max_vertices,
+        )
@@ -0,0 +1,94 @@
+import itertools
+import math
+
+
+class ShapeIndex(object):
+    """Uniform grid over the bounding rects of shapes, for hit tests.
+
+    Each shape is listed in the cell_size square cells its bounding rect
+    overlaps, so query() only looks at the shapes of the cells around a
+    point rather than at all of them. Shapes must be updated after they
+    change, and are returned last added first, like the canvas iterates
+    over its shapes.
+    """
+
+    def __init__(self, cell_size=64):
+        if cell_size <= 0:
+            raise ValueError("Unexpected cell_size: {}".format(cell_size))
+        self.cell_size = cell_size
+        self._counter = itertools.count()
+        self.clear()
+
+    def clear(self):
+        # (column, row): set of shapes
+        self._cells = {}
+        # shape: (order, (x1, y1, x2, y2), cells)
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, shape):
+        return shape in self._entries
+
+    def rebuild(self, shapes):
+        self.clear()
+        for shape in shapes:
+            self.add(shape)
+
+    def _cells_of(self, x1, y1, x2, y2):
+        size = self.cell_size
+        return [
+            (i, j)
+            for i in range(int(math.floor(x1 / size)), int(x2 // size) + 1)
+            for j in range(int(math.floor(y1 / size)), int(y2 // size) + 1)
+        ]
+
+    def add(self, shape, order=None):
+        """Index shape, after those added before unless order is given."""
+        self.remove(shape)
+        if order is None:
+            order = next(self._counter)
+        rect = None
+        cells = []
+        if len(shape):
+            r = shape.boundingRect()
+            rect = (r.left(), r.top(), r.right(), r.bottom())
+            cells = self._cells_of(*rect)
+        for cell in cells:
+            self._cells.setdefault(cell, set()).add(shape)
+        self._entries[shape] = (order, rect, cells)
+
+    def remove(self, shape):
+        entry = self._entries.pop(shape, None)
+        if entry is None:
+            return
+        for cell in entry[2]:
+            self._cells[cell].discard(shape)
+            if not self._cells[cell]:
+                del self._cells[cell]
+
+    def update(self, shape):
+        """Index shape again after it changed, if it is indexed."""
+        entry = self._entries.get(shape)
+        if entry is not None:
+            self.remove(shape)
+            self.add(shape, order=entry[0])
+
+    def query(self, x, y, margin=0):
+        """Shapes whose bounding rect, grown by margin, contains (x, y)."""
+        found = set()
+        for cell in self._cells_of(
+            x - margin, y - margin, x + margin, y + margin
+        ):
+            found.update(self._cells.get(cell, ()))
+        hits = []
+        for shape in found:
+            order, (x1, y1, x2, y2), _ = self._entries[shape]
+            if (
+                x1 - margin <= x <= x2 + margin
+                and y1 - margin <= y <= y2 + margin
+            ):
+                hits.append((order, shape))
+        hits.sort(key=lambda hit: hit[0], reverse=True)
+        return [shape for _, shape in hits]
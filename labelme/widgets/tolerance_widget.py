@@ -0,0 +1,19 @@
+from qtpy import QtCore
+from qtpy import QtGui
+from qtpy import QtWidgets
+
+
+class ToleranceWidget(QtWidgets.QSpinBox):
+    def __init__(self, value=32):
+        super(ToleranceWidget, self).__init__()
+        self.setRange(0, 255)
+        self.setValue(value)
+        self.setToolTip("Magic Wand Tolerance")
+        self.setStatusTip(self.toolTip())
+        self.setAlignment(QtCore.Qt.AlignCenter)
+
+    def minimumSizeHint(self):
+        height = super(ToleranceWidget, self).minimumSizeHint().height()
+        fm = QtGui.QFontMetrics(self.font())
+        width = fm.width(str(self.maximum()))
+        return QtCore.QSize(width, height)
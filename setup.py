@@ -149,6 +149,7 @@ def main():
                 "labelme_draw_label_png=labelme.cli.draw_label_png:main",
                 "labelme_json_to_dataset=labelme.cli.json_to_dataset:main",
                 "labelme_on_docker=labelme.cli.on_docker:main",
+                "labelme_serve_seg=labelme.cli.serve_seg:main",
             ],
         },
     )
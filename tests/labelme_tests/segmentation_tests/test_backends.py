@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from labelme.segmentation import LocalClient
+from labelme.segmentation import SegmentationClient
+from labelme.segmentation import create_client
+
+
+@pytest.mark.parametrize("backend", ["grabcut", "floodfill"])
+def test_LocalClient(backend):
+    img = np.zeros((200, 240, 3), dtype=np.uint8)
+    img[:, :, 1] = np.arange(240) % 7
+    img[80:140, 100:180] = 255
+    client = create_client(backend=backend, local_workers=1, padding=8)
+    assert isinstance(client, LocalClient)
+    try:
+        points = np.array(client.segment(img, "img.png", (90, 70, 190, 150)))
+    finally:
+        client.close()
+    # in image coordinates, although only the box region is segmented
+    assert np.abs(points.min(axis=0) - [100, 80]).max() <= 2
+    assert np.abs(points.max(axis=0) - [179, 139]).max() <= 2
+
+
+def test_create_client():
+    assert isinstance(create_client(url="http://x/"), SegmentationClient)
+    with pytest.raises(ValueError):
+        create_client(backend="unknown")
@@ -0,0 +1,73 @@
+import os
+import os.path as osp
+import threading
+
+import cv2
+import numpy as np
+
+from labelme.segmentation import ResponseCache
+from labelme.segmentation import SegmentationClient
+from labelme.segmentation.server import SegmentationServer
+
+
+def test_ResponseCache(tmpdir):
+    directory = str(tmpdir)
+    cache = ResponseCache(directory, max_bytes=1000)
+    assert cache.get(["a", [0, 0, 4, 4]]) is None
+    cache.put(["a", [0, 0, 4, 4]], [[1, 2], [3, 4]])
+    assert cache.get(("a", (0, 0, 4, 4))) == [[1, 2], [3, 4]]
+
+    # kept across sessions
+    cache = ResponseCache(directory, max_bytes=1000)
+    assert cache.get(["a", [0, 0, 4, 4]]) == [[1, 2], [3, 4]]
+
+    # the least recently used entries go first
+    points = [[i, i] for i in range(20)]
+    for i in range(8):
+        cache.put(["b", i], points)
+        os.utime(cache._path(["b", i]), (i, i))
+    os.utime(cache._path(["a", [0, 0, 4, 4]]), (100, 100))
+    cache.put(["c"], points)
+    assert cache.get(["b", 0]) is None
+    assert cache.get(["a", [0, 0, 4, 4]]) is not None
+    assert cache.get(["c"]) == points
+    size = sum(osp.getsize(path) for _, path, _ in cache._entries())
+    assert size <= 1000
+
+    cache.clear()
+    assert cache.get(["c"]) is None
+
+
+def test_SegmentationClient_cache(tmpdir):
+    img = np.zeros((120, 160, 3), dtype=np.uint8)
+    img[40:80, 50:110] = 255
+    filename = osp.join(str(tmpdir), "img.png")
+    cv2.imwrite(filename, img)
+
+    server = SegmentationServer(("127.0.0.1", 0))
+    boxes = []
+    segment = server.segment
+    server.segment = lambda img, box: boxes.append(box) or segment(img, box)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = "http://127.0.0.1:{}/".format(server.server_port)
+        client = SegmentationClient(
+            url=url, cache_dir=osp.join(str(tmpdir), "cache")
+        )
+        points = client.segment(img, filename, (40, 30, 120, 90))
+        # the same box, up to box_quantum
+        cached = client.segment(img, filename, (41, 30, 120, 89))
+        assert (cached == points).all()
+        assert len(boxes) == 1
+        client.segment(img, filename, (45, 35, 115, 85))
+        assert len(boxes) == 2
+
+        client = SegmentationClient(
+            url=url, cache_dir=osp.join(str(tmpdir), "cache"), model_version=2
+        )
+        client.segment(img, filename, (40, 30, 120, 90))
+        assert len(boxes) == 3
+    finally:
+        server.shutdown()
+        server.server_close()
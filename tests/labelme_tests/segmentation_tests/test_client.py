@@ -0,0 +1,193 @@
+import email.parser
+import http.server
+import json
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from labelme.segmentation import SegmentationClient
+from labelme.segmentation import SegmentationWorker
+
+
+class _Client(object):
+    def __init__(self):
+        self.release = threading.Event()
+
+    def segment(self, img, filename, box):
+        self.release.wait(5)
+        if box is None:
+            raise ValueError("no box")
+        return [[box[0], box[1]], [box[2], box[1]], [box[2], box[3]]]
+
+    def segment_boxes(self, img, filename, boxes):
+        for index, box in reversed(list(enumerate(boxes))):
+            yield index, self.segment(img, filename, box)
+
+
+@pytest.mark.gui
+def test_SegmentationWorker(qtbot):
+    client = _Client()
+    worker = SegmentationWorker(client)
+    client.release.set()
+    with qtbot.waitSignal(worker.finished) as blocker:
+        request = worker.submit(None, "img.jpg", (1, 2, 3, 4))
+    assert blocker.args == [request, [[1, 2], [3, 2], [3, 4]]]
+    assert not worker.pending
+
+    with qtbot.waitSignal(worker.failed) as blocker:
+        request = worker.submit(None, "img.jpg", None)
+    assert blocker.args == [request, "no box"]
+
+
+@pytest.mark.gui
+def test_SegmentationWorker_boxes(qtbot):
+    client = _Client()
+    worker = SegmentationWorker(client)
+    results = []
+    worker.segmented.connect(lambda *args: results.append(args))
+    client.release.set()
+    with qtbot.waitSignal(worker.finished) as blocker:
+        request = worker.submit_boxes(
+            None, "img.jpg", [(0, 0, 1, 1), (0, 0, 2, 2)]
+        )
+    assert blocker.args == [request, None]
+    assert results == [
+        (request, 1, [[0, 0], [2, 0], [2, 2]]),
+        (request, 0, [[0, 0], [1, 0], [1, 1]]),
+    ]
+    assert not worker.pending
+
+    with qtbot.waitSignal(worker.failed) as blocker:
+        request = worker.submit_boxes(None, "img.jpg", [None])
+    assert blocker.args == [request, "no box"]
+
+
+@pytest.mark.gui
+def test_SegmentationWorker_cancel(qtbot):
+    client = _Client()
+    worker = SegmentationWorker(client)
+    results = []
+    worker.finished.connect(lambda *args: results.append(args))
+
+    worker.submit(None, "img.jpg", (0, 0, 1, 1))
+    worker.cancel()
+    assert not worker.pending
+    # superseded by the next one
+    worker.submit(None, "img.jpg", (0, 0, 2, 2))
+    request = worker.submit(None, "img.jpg", (0, 0, 3, 3))
+    assert worker.pending
+    with qtbot.waitSignal(worker.finished):
+        client.release.set()
+    qtbot.wait(100)
+    assert results == [(request, [[0, 0], [3, 0], [3, 3]])]
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        server = self.server
+        server.requests.append(
+            (self.client_address, self.headers.get("Authorization"))
+        )
+        if len(server.requests) == 1:
+            self.send_response(503)
+            body = b""
+        else:
+            self.send_response(200)
+            body = json.dumps({"points": [[1, 2]]}).encode()
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_SegmentationClient():
+    server = http.server.HTTPServer(("127.0.0.1", 0), _Handler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        client = SegmentationClient(
+            url="http://127.0.0.1:{}/".format(server.server_port),
+            token="secret",
+            backoff=0,
+        )
+        img = np.zeros((10, 10, 3), dtype=np.uint8)
+        # the first request fails once and is retried
+        points = client.segment(img, "img.png", (1, 1, 5, 5))
+        assert points.tolist() == [[1, 2]]
+        points = client.segment(img, "img.png", (1, 1, 5, 5))
+        assert points.tolist() == [[1, 2]]
+        client.close()
+    finally:
+        server.shutdown()
+    addresses, tokens = zip(*server.requests)
+    assert len(addresses) == 3
+    assert len(set(addresses)) == 1
+    assert set(tokens) == {"Bearer secret"}
+
+
+class _BoxHandler(http.server.BaseHTTPRequestHandler):
+    """Outlines the box itself, keeping the uploaded images."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        message = email.parser.BytesParser().parsebytes(
+            b"Content-Type: "
+            + self.headers["Content-Type"].encode()
+            + b"\r\n\r\n"
+            + body
+        )
+        fields = {
+            part.get_param("name", header="content-disposition"): part
+            for part in message.get_payload()
+        }
+        img = cv2.imdecode(
+            np.frombuffer(fields["image"].get_payload(decode=True), np.uint8),
+            cv2.IMREAD_UNCHANGED,
+        )
+        self.server.uploads.append((fields["image"].get_filename(), img.shape))
+        x1, y1, x2, y2 = [
+            float(fields[key].get_payload())
+            for key in ["x1", "y1", "x2", "y2"]
+        ]
+        body = json.dumps({"points": [[x1, y1], [x2, y2]]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_SegmentationClient_crop():
+    server = http.server.HTTPServer(("127.0.0.1", 0), _BoxHandler)
+    server.uploads = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = "http://127.0.0.1:{}/".format(server.server_port)
+        img = np.zeros((400, 600, 3), dtype=np.uint8)
+        box = (100.0, 50.0, 300.0, 150.0)
+        client = SegmentationClient(url=url, padding=10)
+        points = client.segment(img, "img.png", box)
+        assert np.allclose(points, [[100, 50], [300, 150]])
+
+        client = SegmentationClient(
+            url=url, padding=10, max_side=100, codec="jpg"
+        )
+        points = client.segment(img, "img.png", box)
+        assert np.allclose(points, [[100, 50], [300, 150]], atol=1)
+    finally:
+        server.shutdown()
+    assert server.uploads == [
+        ("img.png", (121, 221, 3)),
+        ("img.jpg", (55, 100, 3)),
+    ]
@@ -0,0 +1,60 @@
+import concurrent.futures
+import os.path as osp
+import threading
+
+import cv2
+import numpy as np
+
+from labelme.segmentation import SegmentationClient
+from labelme.segmentation import SegmentationPrefetcher
+from labelme.segmentation.server import SegmentationServer
+
+
+def test_SegmentationPrefetcher(tmpdir):
+    filenames = []
+    for i in range(3):
+        img = np.zeros((60, 80, 3), dtype=np.uint8)
+        img[10:50, 20 + i : 60] = 255
+        filenames.append(osp.join(str(tmpdir), "{}.png".format(i)))
+        cv2.imwrite(filenames[-1], img)
+
+    boxes = []
+    server = SegmentationServer(
+        ("127.0.0.1", 0),
+        segment=lambda img, box: boxes.append(box) or [[0, 0], [1, 1]],
+    )
+    stored = []
+    store = server.store
+    server.store = lambda image_id, img: (
+        stored.append(image_id) or store(image_id, img)
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        client = SegmentationClient(
+            url="http://127.0.0.1:{}/".format(server.server_port),
+            sessions=True,
+        )
+        prefetcher = SegmentationPrefetcher(client)
+        prefetcher.prefetch(filenames[:2])
+        concurrent.futures.wait(list(prefetcher._futures.values()))
+        image_ids = [client.image_id(filename) for filename in filenames]
+        assert stored == image_ids[:2]
+        assert prefetcher.uploaded(filenames[1])
+        assert not prefetcher.uploaded(filenames[2])
+        # no box is guessed ahead
+        assert boxes == []
+
+        # uploaded already, so only the new image is sent
+        prefetcher.prefetch(filenames[1:])
+        concurrent.futures.wait(list(prefetcher._futures.values()))
+        assert stored == image_ids
+
+        # box requests only send the image_id of prefetched images
+        client.segment(None, filenames[2], (0, 0, 79, 59))
+        assert boxes == [[0, 0, 79, 59]]
+        assert stored == image_ids
+        prefetcher.close()
+    finally:
+        server.shutdown()
+        server.server_close()
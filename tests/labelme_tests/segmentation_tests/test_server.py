@@ -0,0 +1,175 @@
+import concurrent.futures
+import os.path as osp
+import threading
+
+import cv2
+import numpy as np
+import requests
+
+from labelme.segmentation import SegmentationClient
+from labelme.segmentation.client import decode_points
+from labelme.segmentation.client import encode_points
+from labelme.segmentation.server import SegmentationQueue
+from labelme.segmentation.server import SegmentationServer
+
+
+def test_SegmentationServer_sessions(tmpdir):
+    img = np.zeros((120, 160, 3), dtype=np.uint8)
+    img[40:80, 50:110] = 255
+    filename = osp.join(str(tmpdir), "img.png")
+    cv2.imwrite(filename, img)
+
+    server = SegmentationServer(("127.0.0.1", 0))
+    stored = []
+    store = server.store
+    server.store = lambda *args: stored.append(args[0]) or store(*args)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = "http://127.0.0.1:{}/".format(server.server_port)
+        client = SegmentationClient(url=url, sessions=True)
+        image_id = client.image_id(filename)
+
+        # unknown to the server, so the image is sent along
+        points = client.segment(img, filename, (40, 30, 120, 90))
+        assert stored == [image_id]
+        points = np.asarray(points)
+        assert (points.min(axis=0) == [50, 40]).all()
+        assert (points.max(axis=0) == [109, 79]).all()
+
+        client.segment(img, filename, (45, 35, 115, 85))
+        assert stored == [image_id]
+
+        server.max_images = 0
+        client.upload(filename)
+        assert server.image(image_id) is None
+        client.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_SegmentationServer_queue(tmpdir):
+    img = np.zeros((120, 160, 3), dtype=np.uint8)
+    img[40:80, 50:110] = 255
+    filename = osp.join(str(tmpdir), "img.png")
+    cv2.imwrite(filename, img)
+
+    segment = SegmentationQueue(
+        "floodfill", workers=1, max_batch=4, batch_wait=0.2
+    )
+    server = SegmentationServer(("127.0.0.1", 0), segment=segment)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = "http://127.0.0.1:{}/get_main_object".format(server.server_port)
+        clients = [SegmentationClient(url=url) for _ in range(4)]
+        boxes = [(40, 30, 120, 90), (45, 35, 115, 85)] * 2
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            results = list(
+                executor.map(
+                    lambda args: args[0].segment(img, filename, args[1]),
+                    zip(clients, boxes),
+                )
+            )
+        for points in results:
+            points = np.asarray(points)
+            assert (points.min(axis=0) == [50, 40]).all()
+            assert (points.max(axis=0) == [109, 79]).all()
+
+        metrics = requests.get(
+            "http://127.0.0.1:{}/metrics".format(server.server_port)
+        ).json()
+        assert metrics["requests"] == 4
+        assert metrics["failures"] == 0
+        assert metrics["in_flight"] == 0
+        assert metrics["queue_depth"] == 0
+        # the requests arrived within batch_wait of the first one
+        assert metrics["batches"] < 4
+        assert metrics["latency_ms"]["p50"] <= metrics["latency_ms"]["p99"]
+    finally:
+        server.shutdown()
+        server.server_close()
+        segment.close()
+
+
+class _Response(object):
+    def __init__(self, content_type, content):
+        self.headers = {"Content-Type": content_type}
+        self.content = content
+
+
+def test_encode_points():
+    content_type, body = encode_points([[1, 2], [300, 4]])
+    assert content_type.endswith("dtype=<i2")
+    assert len(body) == 8
+    points = decode_points(_Response(content_type, body))
+    assert points.tolist() == [[1, 2], [300, 4]]
+
+    content_type, body = encode_points([[1.5, 2], [70000, 4]])
+    assert content_type.endswith("dtype=<f4")
+    points = decode_points(_Response(content_type, body))
+    assert points.tolist() == [[1.5, 2], [70000, 4]]
+
+    points = decode_points(_Response("text/html", b'{"points": [[1, 2]]}'))
+    assert points.tolist() == [[1, 2]]
+
+
+def test_SegmentationServer_binary(tmpdir):
+    img = np.zeros((120, 160, 3), dtype=np.uint8)
+    img[40:80, 50:110] = 255
+    filename = osp.join(str(tmpdir), "img.png")
+    cv2.imwrite(filename, img)
+
+    server = SegmentationServer(("127.0.0.1", 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = "http://127.0.0.1:{}/".format(server.server_port)
+        json_client = SegmentationClient(url=url)
+        binary_client = SegmentationClient(url=url, response_format="binary")
+        box = (40, 30, 120, 90)
+        points = binary_client.segment(img, filename, box)
+        assert points.dtype == np.float64
+        assert (points == json_client.segment(img, filename, box)).all()
+        assert points.min(axis=0).tolist() == [50, 40]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_SegmentationServer_boxes(tmpdir):
+    img = np.zeros((120, 160, 3), dtype=np.uint8)
+    img[40:80, 50:110] = 255
+    img[10:30, 10:30] = 255
+    filename = osp.join(str(tmpdir), "img.png")
+    cv2.imwrite(filename, img)
+    boxes = [(40, 30, 120, 90), (5, 5, 35, 35), (5, 5, 6, 6)]
+
+    segment = SegmentationQueue("floodfill", workers=2)
+    server = SegmentationServer(("127.0.0.1", 0), segment=segment)
+    decoded = []
+    imdecode = cv2.imdecode
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = "http://127.0.0.1:{}/".format(server.server_port)
+        for sessions in [False, True]:
+            client = SegmentationClient(url=url, sessions=sessions)
+            single = [client.segment(img, filename, box) for box in boxes]
+            cv2.imdecode = lambda *args: decoded.append(1) or imdecode(*args)
+            try:
+                results = dict(client.segment_boxes(img, filename, boxes))
+            finally:
+                cv2.imdecode = imdecode
+            assert sorted(results) == [0, 1, 2]
+            for index, points in results.items():
+                assert (points == single[index]).all()
+            assert results[1].min(axis=0).tolist() == [10, 10]
+        # one decode per request, and none for the stored image
+        assert decoded == [1]
+        assert server.metrics()["requests"] == 12
+    finally:
+        server.shutdown()
+        server.server_close()
+        segment.close()
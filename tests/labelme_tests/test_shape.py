@@ -0,0 +1,153 @@
+import numpy as np
+from qtpy import QtCore
+
+import labelme.utils
+from labelme.shape import Shape
+
+from .util import square
+
+
+def test_Shape_cached_paths():
+    shape = square()
+    path = shape.linePath()
+    assert shape.linePath() is path
+    assert shape.boundingRect() == QtCore.QRectF(0, 0, 10, 10)
+    assert shape.containsPoint(QtCore.QPointF(5, 5))
+
+    shape.moveVertexBy(2, QtCore.QPointF(10, 10))
+    assert shape.linePath() is not path
+    assert shape.boundingRect() == QtCore.QRectF(0, 0, 20, 20)
+
+    shape.moveBy(QtCore.QPointF(100, 0))
+    assert shape.boundingRect() == QtCore.QRectF(100, 0, 20, 20)
+    assert shape.linePath().boundingRect() == shape.boundingRect()
+    assert not shape.containsPoint(QtCore.QPointF(5, 5))
+
+    shape[0] = QtCore.QPointF(90, 0)
+    assert shape.boundingRect().left() == 90
+    shape.points = [QtCore.QPointF(0, 0), QtCore.QPointF(1, 1)]
+    assert shape.boundingRect() == QtCore.QRectF(0, 0, 1, 1)
+
+
+def test_Shape_vertex_path():
+    shape = square()
+    path = shape.vertexPath()
+    assert shape.vertexPath() is path
+    shape.highlightVertex(0, Shape.MOVE_VERTEX)
+    assert shape.vertexPath() is not path
+    path = shape.vertexPath()
+    Shape.scale = 2.0
+    try:
+        assert shape.vertexPath() is not path
+    finally:
+        Shape.scale = 1.0
+
+
+def test_Shape_copy():
+    shape = square()
+    shape.linePath()
+    copy = shape.copy()
+    copy.moveBy(QtCore.QPointF(1, 1))
+    assert copy.boundingRect() == QtCore.QRectF(1, 1, 10, 10)
+    assert shape.boundingRect() == QtCore.QRectF(0, 0, 10, 10)
+
+
+def test_Shape_point_array():
+    shape = square()
+    assert shape.array.tolist() == [[0, 0], [10, 0], [10, 10], [0, 10]]
+    assert shape.points[2] == QtCore.QPointF(10, 10)
+
+    shape.moveBy(QtCore.QPointF(1, 2))
+    assert shape.array.tolist() == [[1, 2], [11, 2], [11, 12], [1, 12]]
+    assert shape[0] == QtCore.QPointF(1, 2)
+
+    shape.insertPoint(1, QtCore.QPointF(6, 0))
+    assert shape.popPoint() == QtCore.QPointF(1, 12)
+    shape.removePoint(0)
+    assert shape.points == [
+        QtCore.QPointF(6, 0),
+        QtCore.QPointF(11, 2),
+        QtCore.QPointF(11, 12),
+    ]
+
+    shape.points = np.array([[0, 0], [10, 0]])
+    assert len(shape) == 2
+    assert shape.boundingRect() == QtCore.QRectF(0, 0, 10, 0)
+
+
+def test_Shape_addPoint():
+    shape = Shape(shape_type="polygon")
+    points = []
+    for x, y in [(0, 0), (10, 0), (10, 10)]:
+        shape.addPoint(QtCore.QPointF(x, y))
+        points.append(QtCore.QPointF(x, y))
+        assert shape.points == points
+    cached = shape.points
+    shape.addPoint(QtCore.QPointF(0, 10))
+    # the list handed out before is left as it was
+    assert cached == points
+    assert shape.points[-1] == QtCore.QPointF(0, 10)
+    assert shape.boundingRect() == QtCore.QRectF(0, 0, 10, 10)
+
+    # back on the first point, which closes the shape
+    shape.addPoint(QtCore.QPointF(0, 0))
+    assert shape.isClosed()
+    assert len(shape) == 4
+
+
+def test_Shape_nearest():
+    shape = square()
+    for x, y in [(1, 1), (5, -2), (12, 5), (5, 5), (-3, 11), (30, 30)]:
+        point = QtCore.QPointF(x, y)
+        vertices = [labelme.utils.distance(p - point) for p in shape.points]
+        edges = [
+            labelme.utils.distancetoline(point, [shape[i - 1], shape[i]])
+            for i in range(len(shape))
+        ]
+        for epsilon in [2, 4]:
+            for dist, nearest in [
+                (vertices, shape.nearestVertex(point, epsilon)),
+                (edges, shape.nearestEdge(point, epsilon)),
+            ]:
+                if min(dist) > epsilon:
+                    assert nearest is None
+                else:
+                    assert nearest == int(np.argmin(dist))
+
+    assert Shape().nearestVertex(QtCore.QPointF(0, 0), 10) is None
+    assert Shape().nearestEdge(QtCore.QPointF(0, 0), 10) is None
+
+
+def test_Shape_holes():
+    shape = square(size=30)
+    shape.holes = [[[10, 10], [20, 10], [20, 20], [10, 20]]]
+    assert shape.containsPoint(QtCore.QPointF(5, 5))
+    assert not shape.containsPoint(QtCore.QPointF(15, 15))
+    assert shape.linePath().contains(QtCore.QPointF(5, 5))
+    assert not shape.linePath().contains(QtCore.QPointF(15, 15))
+
+    shape.moveBy(QtCore.QPointF(100, 0))
+    assert shape.holes[0].tolist() == [
+        [110, 10],
+        [120, 10],
+        [120, 20],
+        [110, 20],
+    ]
+    assert not shape.containsPoint(QtCore.QPointF(115, 15))
+    copy = shape.copy()
+    copy.moveBy(QtCore.QPointF(1, 1))
+    assert shape.holes[0][0].tolist() == [110, 10]
+
+    # dragged across the hole and back, which keeps it
+    shape.moveVertexBy(2, QtCore.QPointF(-15, -15))
+    assert len(shape.holes) == 1
+    shape.moveVertexBy(2, QtCore.QPointF(15, 15))
+    shape.dropOutsideHoles()
+    assert len(shape.holes) == 1
+
+    # the outline no longer goes around the hole once the edit is done
+    shape.moveVertexBy(2, QtCore.QPointF(-25, -25))
+    path = shape.linePath()
+    shape.dropOutsideHoles()
+    assert shape.holes == []
+    assert shape.linePath() is not path
@@ -0,0 +1,11 @@
+from qtpy import QtCore
+
+from labelme.shape import Shape
+
+
+def square(x=0, y=0, size=10):
+    shape = Shape(shape_type="polygon")
+    for dx, dy in [(0, 0), (size, 0), (size, size), (0, size)]:
+        shape.addPoint(QtCore.QPointF(x + dx, y + dy))
+    shape.close()
+    return shape
@@ -0,0 +1,16 @@
+import numpy as np
+
+from labelme.utils.features import ImageFeatures
+
+
+def test_ImageFeatures():
+    img = np.random.RandomState(0).randint(0, 255, (64, 80, 3))
+    img = img.astype(np.uint8)
+    features = ImageFeatures(img)
+    features.start(pyramid_depth=2)
+    features.wait()
+
+    assert features.pyramid[0] is img
+    assert features.pyramid[2].shape == (16, 20, 3)
+    # cached, not recomputed
+    assert features.pyramid[1] is features.pyramid[1]
@@ -1,3 +1,5 @@
+import numpy as np
+
 from .util import get_img_and_data
 
 from labelme.utils import shape as shape_module
@@ -22,3 +24,59 @@ def test_shape_to_mask():
         points = shape["points"]
         mask = shape_module.shape_to_mask(img.shape[:2], points)
         assert mask.shape == img.shape[:2]
+
+
+def test_simplify_polygon():
+    # a square with a deep, narrow notch in its top edge
+    points = [[0, 0], [10, 0], [10, 10], [6, 10], [5, 1], [4, 10], [0, 10]]
+    assert len(shape_module.simplify_polygon(points, tolerance=0.5)) == 7
+    simplified = shape_module.simplify_polygon(points, tolerance=20)
+    assert simplified.tolist() == [[0, 0], [10, 0], [10, 10]]
+
+    t = np.linspace(0, 2 * np.pi, 500, endpoint=False)
+    r = 100 + 20 * np.sin(7 * t)
+    points = np.stack([r * np.cos(t), r * np.sin(t)], axis=1)
+    simplified = shape_module.simplify_polygon(points, tolerance=1)
+    assert 14 < len(simplified) < 100
+    simplified = shape_module.simplify_polygon(
+        points, tolerance=1, max_vertices=14
+    )
+    assert len(simplified) == 14
+    assert not shape_module._crossing_edges(simplified)
+
+
+def test_crossing_edges():
+    # a bow tie: its two long edges cross
+    ring = [[0, 0], [10, 10], [10, 0], [0, 10]]
+    assert shape_module._crossing_edges(ring) == [0, 2]
+
+    rng = np.random.RandomState(0)
+    ring = rng.randint(0, 30, (200, 2))
+    a, b = ring, np.roll(ring, -1, axis=0)
+
+    def cross(o, p, q):
+        return (p[0] - o[0]) * (q[1] - o[1]) - (p[1] - o[1]) * (q[0] - o[0])
+
+    crossing = set()
+    for i in range(len(ring)):
+        for j in range(len(ring)):
+            if (
+                cross(a[i], b[i], a[j]) * cross(a[i], b[i], b[j]) < 0
+                and cross(a[j], b[j], a[i]) * cross(a[j], b[j], b[i]) < 0
+            ):
+                crossing.add(i)
+    assert shape_module._crossing_edges(ring) == sorted(crossing)
+    assert shape_module._crossing_edges(ring, chunk_size=7) == sorted(crossing)
+
+
+def test_shapes_to_label_holes():
+    shapes = [
+        dict(
+            label="a",
+            points=[[0, 0], [9, 0], [9, 9], [0, 9]],
+            holes=[[[3, 3], [6, 3], [6, 6], [3, 6]]],
+        )
+    ]
+    cls, _ = shape_module.shapes_to_label((10, 10), shapes, {"a": 1})
+    assert cls[1, 1] == 1
+    assert cls[4, 4] == 0
@@ -0,0 +1,43 @@
+import os.path as osp
+
+import cv2
+import numpy as np
+import PIL.Image
+
+from labelme.utils.tiles import TiledImage
+
+
+def test_TiledImage():
+    rng = np.random.RandomState(0)
+    img = rng.randint(0, 255, (100, 130, 3)).astype(np.uint8)
+    tiled = TiledImage(img, tile_size=32, max_tiles=4)
+    assert tiled.shape == img.shape
+    assert tiled.ndim == 3
+
+    assert (tiled[10:70, 20:125] == img[10:70, 20:125]).all()
+    assert (tiled[:, -5:] == img[:, -5:]).all()
+    assert tiled[50:40, 0:10].shape == (0, 10, 3)
+    assert (np.asarray(tiled) == img).all()
+    assert len(tiled._tiles) == 4
+
+
+def test_TiledImage_open(tmpdir):
+    rng = np.random.RandomState(0)
+    img = rng.randint(0, 255, (70, 90, 3)).astype(np.uint8)
+    for extension in [".png", ".bmp", ".ppm", ".tif"]:
+        filename = osp.join(str(tmpdir), "img" + extension)
+        if extension == ".tif":
+            # uncompressed, which cv2 would not write
+            PIL.Image.fromarray(img[:, :, ::-1]).save(filename)
+        else:
+            cv2.imwrite(filename, img)
+
+        tiled = TiledImage.open(filename, tile_size=16)
+        assert (tiled[:, :] == img).all()
+        # uncompressed files are mapped read-only as they are
+        assert tiled.source.flags.writeable == (extension == ".png")
+
+    filename = osp.join(str(tmpdir), "gray.png")
+    cv2.imwrite(filename, img[:, :, 0])
+    tiled = TiledImage.open(filename, tile_size=16)
+    assert (tiled[:, :] == cv2.imread(filename)).all()
@@ -0,0 +1,262 @@
+import numpy as np
+import pytest
+from qtpy import QtCore
+from qtpy import QtGui
+
+from labelme.shape import Shape
+from labelme.widgets import Canvas
+from labelme.widgets.magicwand import SelectionWindow
+
+from ..util import square
+
+
+def _move(canvas, x, y, buttons=QtCore.Qt.NoButton):
+    event = QtGui.QMouseEvent(
+        QtCore.QEvent.MouseMove,
+        QtCore.QPointF(x, y),
+        QtCore.Qt.NoButton,
+        buttons,
+        QtCore.Qt.NoModifier,
+    )
+    canvas.mouseMoveEvent(event)
+
+
+def _release(canvas):
+    event = QtGui.QMouseEvent(
+        QtCore.QEvent.MouseButtonRelease,
+        QtCore.QPointF(canvas.prevMovePoint),
+        QtCore.Qt.LeftButton,
+        QtCore.Qt.NoButton,
+        QtCore.Qt.NoModifier,
+    )
+    canvas.mouseReleaseEvent(event)
+
+
+def _canvas(qtbot):
+    canvas = Canvas(epsilon=10)
+    qtbot.addWidget(canvas)
+    canvas.loadPixmap(QtGui.QPixmap(1000, 1000))
+    canvas.resize(1000, 1000)
+    with qtbot.waitExposed(canvas):
+        canvas.show()
+    shapes = [
+        square(100 * (i % 10), 100 * (i // 10), size=50) for i in range(100)
+    ]
+    canvas.loadShapes(shapes)
+    canvas.setEditing(True)
+    return canvas
+
+
+class _Painted(object):
+    """Record the shapes painted and the regions repainted by a canvas."""
+
+    def __init__(self, canvas):
+        self.shapes = []
+        self.regions = []
+        self._paint = Shape.paint
+        self._canvas = canvas
+
+    def __enter__(self):
+        def paint(shape, painter):
+            self.shapes.append(shape)
+            self._paint(shape, painter)
+
+        def repaint(*args):
+            self.regions.append(QtGui.QRegion(*args))
+            type(self._canvas).repaint(self._canvas, *args)
+
+        Shape.paint = paint
+        self._canvas.repaint = repaint
+        return self
+
+    def __exit__(self, *args):
+        Shape.paint = self._paint
+        del self._canvas.repaint
+
+
+@pytest.mark.gui
+def test_Canvas_dirty_region(qtbot):
+    canvas = _canvas(qtbot)
+    shape = canvas.shapes[11]
+    _move(canvas, 150, 150)
+    assert canvas.hShape is shape and canvas.hVertex == 2
+    # the first move of a drag draws the layer
+    _move(canvas, 160, 155, QtCore.Qt.LeftButton)
+
+    with _Painted(canvas) as painted:
+        _move(canvas, 170, 160, QtCore.Qt.LeftButton)
+    assert shape[2] == QtCore.QPointF(170, 160)
+    (region,) = painted.regions
+    rect = region.boundingRect()
+    assert rect.contains(QtCore.QRect(100, 100, 70, 60))
+    assert rect.width() < 200 and rect.height() < 200
+    # the others are drawn from the layer
+    assert painted.shapes == [shape]
+
+    _release(canvas)
+
+    canvas.setEditing(False)
+    canvas.createMode = "rectangle"
+    with _Painted(canvas) as painted:
+        _move(canvas, 575, 575)
+    # the crosshair, across the whole canvas
+    rect = painted.regions[0].boundingRect()
+    assert rect.width() == canvas.width()
+    assert rect.height() == canvas.height()
+    assert len(painted.shapes) < 30
+
+
+def _grab(canvas):
+    canvas.repaint()
+    image = canvas.grab().toImage()
+    image = image.convertToFormat(QtGui.QImage.Format_ARGB32)
+    pixels = image.bits()
+    pixels.setsize(image.byteCount())
+    return np.frombuffer(pixels, np.uint8).astype(int)
+
+
+@pytest.mark.gui
+def test_Canvas_static_layer(qtbot):
+    canvas = _canvas(qtbot)
+    shapes = canvas.shapes
+    _move(canvas, 150, 150)
+    image = _grab(canvas)
+    assert canvas._layer is None
+
+    _move(canvas, 150, 150, QtCore.Qt.LeftButton)
+    layer = canvas._layer[2]
+    with _Painted(canvas) as painted:
+        for i in range(5):
+            _move(canvas, 150 + i, 150 + i, QtCore.Qt.LeftButton)
+    assert painted.shapes == [shapes[11]] * 5
+    assert canvas._layer[2] is layer
+
+    # the same pixels as when drawing all the shapes, but for rounding
+    _move(canvas, 150, 150, QtCore.Qt.LeftButton)
+    assert (np.abs(_grab(canvas) - image) <= 1).all()
+    canvas.staticLayer = lambda shapes: (QtCore.QRect(), None)
+    assert (np.abs(_grab(canvas) - image) <= 1).all()
+    del canvas.staticLayer
+
+    # the layer is drawn again when the shapes in it change
+    shapes[0].line_color = QtGui.QColor(255, 0, 0)
+    with _Painted(canvas) as painted:
+        _grab(canvas)
+    assert shapes[0] in painted.shapes
+    assert canvas._layer[2] is not layer
+    layer = canvas._layer[2]
+    shapes[0].moveBy(QtCore.QPointF(1, 1))
+    _grab(canvas)
+    assert canvas._layer[2] is not layer
+    layer = canvas._layer[2]
+    canvas.scale = 0.5
+    _grab(canvas)
+    assert canvas._layer[2] is not layer
+
+
+@pytest.mark.gui
+def test_Canvas_static_layer_hover(qtbot):
+    canvas = _canvas(qtbot)
+    _move(canvas, 150, 150)
+    _move(canvas, 150, 150, QtCore.Qt.LeftButton)
+    _release(canvas)
+    layer = canvas._layer
+
+    # hovering does not draw the layer again, only the shapes around
+    with _Painted(canvas) as painted:
+        for x, y in [(250, 150), (250, 250), (350, 250)]:
+            _move(canvas, x, y)
+            canvas.repaint(canvas.shapesRegion([canvas.hShape]))
+    assert canvas._layer is layer
+    assert 0 < len(painted.shapes) < 20
+
+
+@pytest.mark.gui
+def test_Canvas_drag_vertex_holes(qtbot):
+    canvas = _canvas(qtbot)
+    shape = canvas.shapes[11]
+    shape.holes = [[[120, 120], [130, 120], [130, 130], [120, 130]]]
+    _move(canvas, 150, 150)
+    assert canvas.hShape is shape and canvas.hVertex == 2
+
+    # across the hole and back
+    for x, y in [(140, 140), (125, 125), (140, 140), (150, 150)]:
+        _move(canvas, x, y, QtCore.Qt.LeftButton)
+    _release(canvas)
+    assert len(shape.holes) == 1
+
+    _move(canvas, 150, 150)
+    _move(canvas, 125, 125, QtCore.Qt.LeftButton)
+    _release(canvas)
+    assert shape.holes == []
+
+
+@pytest.mark.gui
+def test_Canvas_magic_wand_seeds(qtbot):
+    canvas = Canvas(magic_wand_batch_interval=1000)
+    qtbot.addWidget(canvas)
+    for reset in [
+        lambda: canvas.loadPixmap(QtGui.QPixmap(100, 100)),
+        canvas.resetState,
+    ]:
+        # Shift-clicks still queued when the image changes
+        canvas._magicWandSeeds.append((10, 10, True))
+        canvas._magicWandTimer.start(1000)
+        reset()
+        assert canvas._magicWandSeeds == []
+        assert not canvas._magicWandTimer.isActive()
+
+
+@pytest.mark.gui
+def test_Canvas_magic_wand_batch(qtbot):
+    img = np.zeros((100, 100, 3), dtype=np.uint8)
+    img[20:40, 20:40] = 100
+    img[60:80, 60:80] = 100
+    canvas = Canvas(magic_wand_batch_interval=1000)
+    qtbot.addWidget(canvas)
+    canvas.loadPixmap(QtGui.QPixmap(100, 100))
+    canvas.resize(100, 100)
+    canvas.imageSelectionWindow = SelectionWindow(img, tolerance=10)
+    selection = canvas.imageSelectionWindow
+    selection._ix, selection._iy, selection._x, selection._y = 0, 0, 99, 99
+    canvas.mode = canvas.LABEL
+    for x, y in [(30, 30), (70, 70)]:
+        current = canvas.current
+        event = QtGui.QMouseEvent(
+            QtCore.QEvent.MouseButtonPress,
+            QtCore.QPointF(x, y),
+            QtCore.Qt.LeftButton,
+            QtCore.Qt.LeftButton,
+            QtCore.Qt.ShiftModifier,
+        )
+        canvas.mousePressEvent(event)
+        # the polygon drawn so far stays until the batch is filled
+        assert canvas.current is current
+    assert len(canvas._magicWandSeeds) == 2
+
+    canvas.flushMagicWand()
+    assert canvas.current.isClosed()
+    assert selection.mask[30, 30] and selection.mask[70, 70]
+
+
+@pytest.mark.gui
+def test_Canvas_magic_wand_tolerance_api(qtbot):
+    img = np.zeros((100, 100, 3), dtype=np.uint8)
+    img[20:60, 20:80] = 100
+    canvas = Canvas()
+    qtbot.addWidget(canvas)
+    canvas.imageSelectionWindow = SelectionWindow(img, tolerance=10)
+    selection = canvas.imageSelectionWindow
+    selection._ix, selection._iy, selection._x, selection._y = 0, 0, 99, 99
+    canvas.mode = canvas.LABEL
+    # polygon of the segmentation API covering the left half of the region
+    canvas.api_points = [[20, 20], [50, 20], [50, 59], [20, 59]]
+    selection.fill_seeds([(70, 40, True)])
+
+    # the tolerance change keeps the API polygon and adds the wand region
+    canvas.setMagicWandTolerance(5)
+    points = [(p.x(), p.y()) for p in canvas.current.points]
+    assert canvas.current.isClosed()
+    for point in canvas.api_points:
+        assert tuple(point) in points
+    assert max(x for x, _ in points) == 79
@@ -0,0 +1,271 @@
+import cv2
+import numpy as np
+
+from labelme.utils.shape import _crossing_edges
+from labelme.utils.shape import shape_to_mask
+from labelme.utils.tiles import TiledImage
+from labelme.widgets.magicwand import FloodFillEngine
+from labelme.widgets.magicwand import SelectionWindow
+
+
+def _make_img():
+    img = np.zeros((60, 80, 3), dtype=np.uint8)
+    img[10:30, 20:50] = 200
+    return img
+
+
+def test_FloodFillEngine_confined_to_box():
+    img = np.full((60, 80, 3), 100, dtype=np.uint8)
+    engine = FloodFillEngine(img)
+    engine.set_box(10, 5, 40, 25)
+    assert engine.origin == (10, 5)
+    assert engine.shape == (21, 31)
+
+    mask = engine.fill(20, 10, (32,) * 3)
+    # everything strictly inside the outline is selected
+    assert (mask[1:-1, 1:-1] == 255).all()
+    assert mask[[0, -1], :].sum() == 0
+    assert mask[:, [0, -1]].sum() == 0
+
+    # seeds on the outline do not fill anything
+    assert engine.fill(10, 10, (32,) * 3).sum() == 0
+
+
+def test_SelectionWindow_same_as_full_image_fill():
+    # the fill used to run on the whole image with the box drawn on it
+    rng = np.random.RandomState(0)
+    img = rng.randint(0, 150, (90, 120, 3)).astype(np.uint8)
+    img = cv2.GaussianBlur(img, (0, 0), 2)
+    for connectivity in [4, 8]:
+        flags = connectivity | cv2.FLOODFILL_FIXED_RANGE
+        flags |= cv2.FLOODFILL_MASK_ONLY | 255 << 8
+        for tolerance in [2, 5, 10, 30]:
+            for box, seed in [
+                ((10, 5, 100, 80), (50, 40)),
+                ((10, 5, 100, 80), (11, 6)),
+                ((60, 70, 20, 30), (40, 50)),
+                ((0, 0, 119, 89), (99, 9)),
+            ]:
+                selection = SelectionWindow(
+                    img, connectivity=connectivity, tolerance=tolerance
+                )
+                selection._ix, selection._iy, selection._x, selection._y = box
+                selection._shift_key(*seed)
+
+                boxed = cv2.rectangle(
+                    img.copy(), box[:2], box[2:], (255, 38, 0), 1
+                )
+                mask = np.zeros((92, 122), dtype=np.uint8)
+                cv2.floodFill(
+                    boxed,
+                    mask,
+                    seed,
+                    0,
+                    (tolerance,) * 3,
+                    (tolerance,) * 3,
+                    flags,
+                )
+                assert (selection.mask == mask[1:-1, 1:-1]).all()
+
+
+def test_SelectionWindow_shift_alt():
+    img = _make_img()
+    selection = SelectionWindow(img)
+    selection._reset_slidewindow()
+    selection._ix, selection._iy = 15, 5
+    selection._x, selection._y = 55, 35
+
+    points = selection._shift_key(30, 20)
+    assert len(points) > 0
+    assert (selection.mask[10:30, 20:50] == 255).all()
+    assert selection.mask.sum() == 255 * 20 * 30
+    for point in points:
+        assert 20 <= point.x() < 50
+        assert 10 <= point.y() < 30
+
+    selection._alt_key(30, 20)
+    assert selection.mask.sum() == 0
+
+    selection._reset_slidewindow()
+    assert selection._contours() == []
+
+
+def test_SelectionWindow_barrier():
+    rng = np.random.RandomState(0)
+    img = rng.randint(0, 255, (40, 50, 3)).astype(np.uint8)
+    for connectivity in [4, 8]:
+        floodfill = SelectionWindow(img, connectivity=connectivity)
+        barrier = SelectionWindow(
+            img, connectivity=connectivity, method="barrier"
+        )
+        for selection in [floodfill, barrier]:
+            selection._ix, selection._iy = 2, 3
+            selection._x, selection._y = 45, 35
+            selection._shift_key(20, 20)
+
+        for tolerance in [0, 40, 120, 255]:
+            floodfill.set_tolerance(tolerance)
+            barrier.set_tolerance(tolerance)
+            assert (floodfill.mask == barrier.mask).all()
+
+
+def test_SelectionWindow_pyramid():
+    img = np.zeros((300, 400, 3), dtype=np.uint8)
+    img[50:230, 60:330] = 200
+    floodfill = SelectionWindow(img)
+    pyramid = SelectionWindow(img, method="pyramid", pyramid_depth=3)
+    for selection in [floodfill, pyramid]:
+        selection._ix, selection._iy = 10, 10
+        selection._x, selection._y = 390, 290
+        selection._shift_key(100, 100)
+    assert (floodfill.mask == pyramid.mask).all()
+
+    # too small to survive downsampling: falls back to a plain fill
+    img[150, 150] = 100
+    pyramid = SelectionWindow(img, method="pyramid", pyramid_depth=3)
+    pyramid._shift_key(150, 150)
+    assert pyramid.mask.sum() == 255
+
+
+def test_SelectionWindow_undo_redo():
+    img = _make_img()
+    img[40:50, 60:70] = 100
+    selection = SelectionWindow(img)
+    assert selection.undo() is None
+
+    selection._shift_key(30, 20)
+    first = selection.mask
+    selection._shift_key(65, 45)
+    both = selection.mask
+    selection._alt_key(30, 20)
+    assert selection.mask.sum() == 255 * 10 * 10
+
+    assert selection.undo() is not None
+    assert (selection.mask == both).all()
+    assert selection.undo() is not None
+    assert (selection.mask == first).all()
+    assert selection.redo() is not None
+    assert (selection.mask == both).all()
+
+    # a new click drops what is left to redo
+    selection._alt_key(65, 45)
+    assert (selection.mask == first).all()
+    assert selection.redo() is None
+
+    # the latest click is kept whatever the budget
+    selection.history.budget = 0
+    selection._shift_key(65, 45)
+    assert len(selection.history) == 1
+    selection.undo()
+    assert (selection.mask == first).all()
+    assert selection.undo() is None
+
+
+def test_SelectionWindow_fill_seeds():
+    img = _make_img()
+    img[40:50, 60:70] = 100
+    img[15:20, 25:30] = 50
+    seeds = [(30, 20, True), (65, 45, True), (27, 17, False)]
+
+    clicks = SelectionWindow(img)
+    for x, y, add in seeds:
+        points = clicks._shift_key(x, y) if add else clicks._alt_key(x, y)
+    batch = SelectionWindow(img)
+    assert batch.fill_seeds(seeds) == points
+    assert (batch.mask == clicks.mask).all()
+    assert batch.fill_seeds([]) is None
+
+    # the seeds are undone together
+    assert batch.undo() == []
+    assert batch.mask.sum() == 0
+
+
+def test_SelectionWindow_simplify():
+    img = _make_img()
+    selection = SelectionWindow(img, simplify_tolerance=1)
+    points = selection._shift_key(30, 20)
+    corners = {(point.x(), point.y()) for point in points}
+    assert corners == {(20, 10), (49, 10), (49, 29), (20, 29)}
+
+    selection.max_vertices = 3
+    assert len(selection.simplify([[0, 0], [10, 0], [10, 10], [0, 10]])) == 3
+
+    # every region is kept, each one simplified
+    img[40:50, 60:70] = 100
+    selection = SelectionWindow(img, simplify_tolerance=1)
+    selection.fill_seeds([(30, 20, True), (65, 45, True)])
+    corners = {(point.x(), point.y()) for point in selection._contours()}
+    assert corners == {
+        (20, 10),
+        (49, 10),
+        (49, 29),
+        (20, 29),
+        (60, 40),
+        (69, 40),
+        (69, 49),
+        (60, 49),
+    }
+    points = [(point.x(), point.y()) for point in selection._contours()]
+    assert _crossing_edges(points) == []
+
+    # an L-shaped selection left by an Alt+click stays in contour order
+    img = np.zeros((100, 100, 3), dtype=np.uint8)
+    img[10:90, 10:90] = 100
+    img[10:70, 30:90] = 200
+    selection = SelectionWindow(img, tolerance=10, simplify_tolerance=1)
+    selection._ix, selection._iy, selection._x, selection._y = 0, 0, 99, 99
+    selection.fill_seeds([(20, 20, True), (50, 50, True)])
+    points = selection._alt_key(50, 50)
+    points = [(point.x(), point.y()) for point in points]
+    assert points == [
+        (10, 10),
+        (10, 89),
+        (89, 89),
+        (89, 70),
+        (30, 70),
+        (29, 10),
+    ]
+    assert _crossing_edges(points) == []
+
+
+def test_SelectionWindow_components():
+    img = np.zeros((60, 80, 3), dtype=np.uint8)
+    img[5:40, 5:30] = 200
+    img[10:20, 10:20] = 0
+    img[5:15, 40:70] = 200
+    selection = SelectionWindow(img, contour_mode="components")
+    selection.fill_seeds([(6, 6, True), (50, 10, True)])
+
+    (exterior, holes), (part, part_holes) = selection.components()
+    assert exterior.min(axis=0).tolist() == [5, 5]
+    assert exterior.max(axis=0).tolist() == [29, 39]
+    assert len(holes) == 1
+    # on the background side of the hole
+    assert holes[0].min(axis=0).tolist() == [10, 10]
+    assert holes[0].max(axis=0).tolist() == [19, 19]
+    assert part.min(axis=0).tolist() == [40, 5]
+    assert part_holes == []
+
+    # the polygons with their holes cover the selection exactly
+    mask = np.zeros((60, 80), dtype=bool)
+    for outline, rings in selection.components():
+        region = shape_to_mask(mask.shape, outline.tolist())
+        for hole in rings:
+            region &= ~shape_to_mask(mask.shape, hole.tolist())
+        mask |= region
+    assert (mask == (selection.mask > 0)).all()
+
+    # the polygon while labeling is the largest region
+    points = selection._contours()
+    assert [[p.x(), p.y()] for p in points] == exterior.tolist()
+
+
+def test_SelectionWindow_tiled():
+    img = _make_img()
+    tiled = SelectionWindow(TiledImage(img, tile_size=16, max_tiles=2))
+    selection = SelectionWindow(img)
+    for window in [tiled, selection]:
+        window._ix, window._iy = 15, 5
+        window._x, window._y = 55, 35
+    assert tiled._shift_key(30, 20) == selection._shift_key(30, 20)
+    assert (tiled.mask == selection.mask).all()
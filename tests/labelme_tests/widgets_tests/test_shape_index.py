@@ -0,0 +1,97 @@
+import pytest
+from qtpy import QtCore
+from qtpy import QtGui
+
+from labelme.shape import Shape
+from labelme.widgets import Canvas
+from labelme.widgets.shape_index import ShapeIndex
+
+from ..util import square
+
+
+def test_ShapeIndex():
+    index = ShapeIndex(cell_size=16)
+    a, b, c = square(0, 0), square(5, 5), square(100, 100, size=50)
+    index.rebuild([a, b, c])
+    assert len(index) == 3
+    assert index.query(7, 7) == [b, a]
+    assert index.query(12, 12) == [b]
+    assert index.query(13, 13, margin=3) == [b, a]
+    assert index.query(120, 140) == [c]
+    assert index.query(60, 60) == []
+
+    c.moveBy(QtCore.QPointF(-100, -100))
+    index.update(c)
+    assert index.query(7, 7) == [c, b, a]
+    assert index.query(120, 140) == []
+
+    index.remove(b)
+    assert index.query(7, 7) == [c, a]
+    assert b not in index
+    # only indexed shapes are updated
+    index.update(b)
+    assert len(index) == 2
+
+
+def _hover(canvas, x, y):
+    event = QtGui.QMouseEvent(
+        QtCore.QEvent.MouseMove,
+        QtCore.QPointF(x, y),
+        QtCore.Qt.NoButton,
+        QtCore.Qt.NoButton,
+        QtCore.Qt.NoModifier,
+    )
+    canvas.mouseMoveEvent(event)
+
+
+def _hover_tests(count):
+    canvas = Canvas(epsilon=10)
+    canvas.loadPixmap(QtGui.QPixmap(1000, 1000))
+    shapes = [
+        square(10 * (i % 100), 10 * (i // 100), size=8) for i in range(count)
+    ]
+    canvas.loadShapes(shapes)
+
+    tests = []
+    nearestVertex = Shape.nearestVertex
+
+    def counted(shape, point, epsilon):
+        tests.append(shape)
+        return nearestVertex(shape, point, epsilon)
+
+    Shape.nearestVertex = counted
+    try:
+        _hover(canvas, 505, 5)
+        _hover(canvas, 215, 95)
+    finally:
+        Shape.nearestVertex = nearestVertex
+    return canvas, tests
+
+
+def _first_near(canvas, x, y):
+    # what the canvas found by testing all shapes
+    for shape in reversed(canvas.shapes):
+        if shape.nearestVertex(QtCore.QPointF(x, y), 10) is not None:
+            return shape
+
+
+@pytest.mark.gui
+def test_Canvas_hover(qtbot):
+    # the shapes tested per mouse move do not depend on how many there are
+    _, few = _hover_tests(1000)
+    canvas, many = _hover_tests(5000)
+    assert 0 < len(many) == len(few) < 20
+    assert canvas.hShape is _first_near(canvas, 215, 95)
+
+    canvas.deleteShape(canvas.hShape)
+    _hover(canvas, 215, 95)
+    assert canvas.hShape is _first_near(canvas, 215, 95)
+
+    shape = canvas.shapes[0]
+    canvas.selectedShapes = [shape]
+    canvas.prevPoint = QtCore.QPointF(0, 0)
+    canvas.calculateOffsets(canvas.prevPoint)
+    canvas.boundedMoveShapes([shape], QtCore.QPointF(500, 800))
+    # away from the other shapes
+    _hover(canvas, 504, 804)
+    assert canvas.hShape is shape